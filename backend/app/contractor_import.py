@@ -0,0 +1,260 @@
+import csv
+import os
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from pydantic import ValidationError
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, geo, models, schemas
+from .database import AsyncSessionLocal
+from .phone import normalize_phone
+
+# Rows written per transaction
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+
+# Chunk size used when spooling the upload to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Per-row errors kept on a job; the failed counter keeps counting past this
+MAX_REPORTED_ERRORS = 1000
+
+# Finished jobs kept for polling before the oldest is dropped
+MAX_TRACKED_JOBS = 100
+
+REQUIRED_COLUMNS = ["Contact Person", "Email"]
+
+# Reported for every row of a batch that could not be written
+BATCH_FAILED = "Not imported: the batch containing this row could not be saved"
+
+class ContractorImportJobs:
+    """In-process registry of import jobs, polled through the job endpoint"""
+
+    def __init__(self, max_jobs: int = MAX_TRACKED_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Tuple[int, schemas.ContractorImportJob]]" = OrderedDict()
+
+    def create(self, owner_id: int) -> schemas.ContractorImportJob:
+        job = schemas.ContractorImportJob(
+            id=uuid.uuid4().hex, status="queued", created_at=datetime.now()
+        )
+        self._jobs[job.id] = (owner_id, job)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str, owner_id: int) -> Optional[schemas.ContractorImportJob]:
+        entry = self._jobs.get(job_id)
+        if entry is None or entry[0] != owner_id:
+            return None
+        return entry[1]
+
+# Create a singleton instance
+import_jobs = ContractorImportJobs()
+
+def _copy_upload(source, destination) -> None:
+    shutil.copyfileobj(source, destination, UPLOAD_CHUNK_SIZE)
+
+async def spool_upload(upload: UploadFile) -> str:
+    """
+    Copy an uploaded CSV to a temp file owned by the import job
+
+    The request's upload is closed once the response is sent, so the
+    background job reads from its own copy.
+
+    Returns:
+        Path of the temp file; the import job deletes it when done
+    """
+    fd, path = tempfile.mkstemp(prefix="contractor_import_", suffix=".csv")
+    with os.fdopen(fd, "wb") as destination:
+        await upload.seek(0)
+        await run_in_threadpool(_copy_upload, upload.file, destination)
+    return path
+
+def _read_rows(reader: csv.DictReader, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+    """Read up to `limit` rows, paired with the CSV line they ended on"""
+    rows = []
+    for row in reader:
+        rows.append((reader.line_num, row))
+        if len(rows) >= limit:
+            break
+    return rows
+
+def _split_name(contact_person: str) -> Tuple[str, str]:
+    first_name, _, last_name = contact_person.partition(" ")
+    return first_name, last_name.strip()
+
+def _location(row: schemas.ContractorImportRow) -> Optional[str]:
+    state_zip = " ".join(part for part in [row.state, row.zip_code] if part)
+    parts = [part for part in [row.address, row.city, state_zip] if part]
+    return ", ".join(parts) or None
+
+def _user_values(row: schemas.ContractorImportRow) -> Dict[str, Any]:
+    first_name, last_name = _split_name(row.contact_person)
+    location = _location(row)
+    return {
+        "email": row.email,
+        "first_name": first_name,
+        "last_name": last_name,
+        "phone": row.phone,
+        "phone_e164": normalize_phone(row.phone),
+        "company_name": row.company_name,
+        "user_type": schemas.UserType.SUBCONTRACTOR,
+        "location": location,
+        **geo.location_columns(location),
+    }
+
+def _record_error(job: schemas.ContractorImportJob, line: int, error: str) -> None:
+    job.failed += 1
+    if len(job.errors) < MAX_REPORTED_ERRORS:
+        job.errors.append(schemas.ContractorImportError(row=line, error=error))
+
+async def _write_batch(
+    job: schemas.ContractorImportJob,
+    rows: List[Tuple[int, schemas.ContractorImportRow]],
+    created_by: int,
+) -> None:
+    """
+    Insert one batch of validated rows in a single transaction
+
+    Rows whose email already has an account are skipped. Rows whose phone
+    number belongs to an existing account, or to an earlier row in the
+    file, are rejected with an error, as registration rejects them; a
+    number routes SMS replies to exactly one contractor. A row whose email
+    is taken by a project leader while the batch is written is rejected
+    too, rather than attaching a subcontractor to that account.
+    """
+    users_by_email = {row.email: _user_values(row) for _, row in rows}
+    line_by_email = {row.email: line for line, row in rows}
+
+    async with AsyncSessionLocal() as db:
+        try:
+            # Contractors that already have an account are left untouched
+            result = await db.execute(
+                select(models.User.email).where(models.User.email.in_(users_by_email))
+            )
+            existing = set(result.scalars().all())
+            new_users = [values for email, values in users_by_email.items() if email not in existing]
+
+            rejected = []
+            phones = {values["phone_e164"] for values in new_users if values["phone_e164"]}
+            if phones:
+                result = await db.execute(
+                    select(models.User.phone_e164).where(models.User.phone_e164.in_(phones))
+                )
+                taken = set(result.scalars().all())
+                accepted = []
+                for values in new_users:
+                    if values["phone_e164"] in taken:
+                        rejected.append((values["email"], f"{crud.PHONE_NUMBER_IN_USE}: {values['phone']}"))
+                        continue
+                    if values["phone_e164"]:
+                        taken.add(values["phone_e164"])
+                    accepted.append(values)
+                new_users = accepted
+
+            inserted = 0
+            if new_users:
+                await db.execute(
+                    crud.insert_ignoring_conflicts(db, models.User.__table__), new_users
+                )
+                result = await db.execute(
+                    select(models.User.id, models.User.email, models.User.user_type).where(
+                        models.User.email.in_([values["email"] for values in new_users])
+                    )
+                )
+                # A concurrent registration may have taken an email since the
+                # check above; only subcontractor accounts get a profile
+                user_ids = []
+                for user_id, email, user_type in result.all():
+                    if user_type == schemas.UserType.SUBCONTRACTOR:
+                        user_ids.append(user_id)
+                    else:
+                        rejected.append((email, f"Email belongs to a project leader account: {email}"))
+                inserted = len(user_ids)
+                if user_ids:
+                    await db.execute(
+                        crud.insert_ignoring_conflicts(db, models.Subcontractor.__table__),
+                        [
+                            {"user_id": user_id, "created_by": created_by, "has_insurance": False}
+                            for user_id in user_ids
+                        ],
+                    )
+
+            await db.commit()
+            job.inserted += inserted
+            job.skipped += len(rows) - inserted - len(rejected)
+            for email, error in rejected:
+                _record_error(job, line_by_email[email], error)
+        except Exception as e:
+            await db.rollback()
+            # The exception can quote SQL parameters from other rows, so it
+            # stays in the log and the job only says the batch failed
+            print(f"Error importing contractor batch: {e}")
+            for line, _ in rows:
+                _record_error(job, line, BATCH_FAILED)
+
+async def run_import(job: schemas.ContractorImportJob, path: str, created_by: int) -> None:
+    """
+    Import contractors from a spooled CSV in fixed-size batches
+
+    Args:
+        job: Job record updated with progress as batches complete
+        path: Temp file written by `spool_upload`; removed when done
+        created_by: ID of the project leader running the import
+    """
+    job.status = "running"
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as csv_file:
+            reader = csv.DictReader(csv_file)
+            fieldnames = await run_in_threadpool(lambda: reader.fieldnames)
+            missing = [column for column in REQUIRED_COLUMNS if column not in (fieldnames or [])]
+            if missing:
+                job.status = "failed"
+                _record_error(job, 1, f"Missing columns: {', '.join(missing)}")
+                return
+
+            seen_emails = set()
+            while True:
+                raw_rows = await run_in_threadpool(_read_rows, reader, IMPORT_BATCH_SIZE)
+                if not raw_rows:
+                    break
+
+                valid_rows = []
+                for line, raw_row in raw_rows:
+                    try:
+                        row = schemas.ContractorImportRow.model_validate(raw_row)
+                    except ValidationError as e:
+                        _record_error(job, line, "; ".join(
+                            f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+                            for error in e.errors()
+                        ))
+                        continue
+
+                    if row.email in seen_emails:
+                        _record_error(job, line, f"Duplicate email in file: {row.email}")
+                        continue
+                    seen_emails.add(row.email)
+                    valid_rows.append((line, row))
+
+                if valid_rows:
+                    await _write_batch(job, valid_rows, created_by)
+                job.processed += len(raw_rows)
+
+        job.status = "completed"
+    except (csv.Error, UnicodeDecodeError) as e:
+        job.status = "failed"
+        _record_error(job, job.processed + 1, f"Unreadable CSV: {e}")
+    except Exception as e:
+        print(f"Error importing contractors: {e}")
+        job.status = "failed"
+        _record_error(job, job.processed + 1, "Import stopped by an internal error")
+    finally:
+        job.finished_at = datetime.now()
+        os.remove(path)
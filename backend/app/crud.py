@@ -0,0 +1,426 @@
+from sqlalchemy import Table, and_, delete, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import base64
+import json
+
+from . import geo, models, schemas
+from .phone import normalize_phone
+from .skill_catalog import skill_catalog
+
+# Dialects with INSERT ... ON CONFLICT ... RETURNING support
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+def insert_ignoring_conflicts(db: AsyncSession, table: Table):
+    """INSERT that skips rows violating a unique constraint where the dialect supports it"""
+    dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is None:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing()
+
+async def _upsert(
+    db: AsyncSession,
+    model,
+    values: Dict[str, Any],
+    conflict_column: str,
+    update_columns: Iterable[str],
+) -> int:
+    """
+    Insert a row or update it on a unique-key conflict in one statement
+
+    Args:
+        db: Database session
+        model: Mapped class to write to
+        values: Column values for the insert
+        conflict_column: Unique column that identifies an existing row
+        update_columns: Columns to overwrite when the row already exists
+
+    Returns:
+        The primary key of the inserted or updated row
+    """
+    table = model.__table__
+    dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+
+    if dialect_insert is not None:
+        stmt = dialect_insert(table).values(**values)
+        # Updating the conflict column to itself makes RETURNING yield the id
+        # even when there is nothing else to update
+        set_ = {column: stmt.excluded[column] for column in update_columns} or {
+            conflict_column: stmt.excluded[conflict_column]
+        }
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[conflict_column]], set_=set_
+        ).returning(table.c.id)
+        result = await db.execute(stmt)
+        return result.scalar_one()
+
+    # Fallback for dialects without ON CONFLICT: lookup then write, same transaction
+    result = await db.execute(
+        select(table.c.id).where(table.c[conflict_column] == values[conflict_column])
+    )
+    existing_id = result.scalar_one_or_none()
+    if existing_id is None:
+        result = await db.execute(insert(table).values(**values))
+        return result.inserted_primary_key[0]
+
+    update_values = {column: values[column] for column in update_columns}
+    if update_values:
+        await db.execute(table.update().where(table.c.id == existing_id).values(**update_values))
+    return existing_id
+
+async def sync_skills(
+    db: AsyncSession,
+    association: Table,
+    owner_column: str,
+    owner_id: int,
+    skill_ids: List[int],
+) -> List[Dict[str, Any]]:
+    """
+    Make an owner's skill associations match `skill_ids` with set-based writes
+
+    Skill IDs are resolved against the cached catalog, which reloads from
+    the skills table for IDs it doesn't know; IDs with no skill are
+    ignored, as they were when skills were loaded by ID.
+
+    Returns:
+        The owner's skills after the update, ordered by name
+    """
+    skills = await skill_catalog.get_many(skill_ids, db)
+    wanted = {skill["id"] for skill in skills}
+
+    owner = association.c[owner_column]
+    result = await db.execute(select(association.c.skill_id).where(owner == owner_id))
+    current = set(result.scalars().all())
+
+    to_remove = current - wanted
+    if to_remove:
+        await db.execute(
+            delete(association).where(owner == owner_id, association.c.skill_id.in_(to_remove))
+        )
+
+    to_add = wanted - current
+    if to_add:
+        await db.execute(
+            insert(association),
+            [{owner_column: owner_id, "skill_id": skill_id} for skill_id in to_add],
+        )
+    return skills
+
+class PhoneNumberInUse(ValueError):
+    """The phone number belongs to another user"""
+
+PHONE_NUMBER_IN_USE = "Phone number is already registered to another user"
+
+def is_phone_conflict(error: IntegrityError) -> bool:
+    """Whether an IntegrityError comes from the unique index on users.phone_e164"""
+    return "phone_e164" in str(error.orig)
+
+async def upsert_user(db: AsyncSession, user: schemas.UserCreate) -> int:
+    """
+    Create or update a user keyed by Firebase UID and return its id
+
+    A phone number belongs to one user, since replies to reminders are
+    routed by number. Registering with a number another user already
+    has is rejected, and so is an imported row with a taken number.
+
+    Raises:
+        PhoneNumberInUse: If another user already has the same phone
+            number, including one registered concurrently
+    """
+    values = user.dict()
+    values["phone_e164"] = normalize_phone(values.get("phone"))
+    if values["phone_e164"] is not None:
+        result = await db.execute(
+            select(models.User.firebase_uid).where(models.User.phone_e164 == values["phone_e164"])
+        )
+        owner = result.scalar_one_or_none()
+        if owner is not None and owner != user.firebase_uid:
+            raise PhoneNumberInUse(PHONE_NUMBER_IN_USE)
+    update_columns = [column for column in values if column != "firebase_uid"]
+    try:
+        return await _upsert(db, models.User, values, "firebase_uid", update_columns)
+    except IntegrityError as e:
+        # Another registration took the number after the check above
+        if is_phone_conflict(e):
+            raise PhoneNumberInUse(PHONE_NUMBER_IN_USE) from e
+        raise
+
+async def upsert_subcontractor(
+    db: AsyncSession, subcontractor: schemas.SubcontractorCreate
+) -> schemas.Subcontractor:
+    """
+    Register or update a subcontractor, its user and its skills
+
+    The caller owns the transaction and commits once afterwards. The
+    response is built from the payload and the skill catalog, so no rows
+    are read back.
+
+    Args:
+        db: Database session
+        subcontractor: Registration payload
+
+    Returns:
+        The subcontractor with its user and skills
+    """
+    user_id = await upsert_user(db, subcontractor.user)
+    subcontractor_id = await _upsert(
+        db,
+        models.Subcontractor,
+        {
+            "user_id": user_id,
+            "created_by": user_id,
+            "hourly_rate": subcontractor.hourly_rate,
+            "has_insurance": subcontractor.has_insurance,
+        },
+        "user_id",
+        ["hourly_rate", "has_insurance"],
+    )
+    skills = await sync_skills(
+        db, models.subcontractor_skills, "subcontractor_id", subcontractor_id, subcontractor.skill_ids
+    )
+    return schemas.Subcontractor(
+        id=subcontractor_id,
+        hourly_rate=subcontractor.hourly_rate,
+        has_insurance=subcontractor.has_insurance,
+        user=schemas.User(id=user_id, **subcontractor.user.dict()),
+        skills=skills,
+    )
+
+async def upsert_project_leader(
+    db: AsyncSession, project_leader: schemas.ProjectLeaderCreate
+) -> schemas.ProjectLeader:
+    """
+    Register or update a project leader, its user and its skills
+
+    The caller owns the transaction and commits once afterwards.
+
+    Args:
+        db: Database session
+        project_leader: Registration payload
+
+    Returns:
+        The project leader with its user and skills
+    """
+    user_id = await upsert_user(db, project_leader.user)
+    project_leader_id = await _upsert(
+        db, models.ProjectLeader, {"user_id": user_id}, "user_id", []
+    )
+    skills = await sync_skills(
+        db, models.project_leader_skills, "project_leader_id", project_leader_id, project_leader.skill_ids
+    )
+    return schemas.ProjectLeader(
+        id=project_leader_id,
+        user=schemas.User(id=user_id, **project_leader.user.dict()),
+        skills=skills,
+    )
+
+
+async def set_project_assignments(
+    db: AsyncSession, project_id: int, contractor_ids: List[int]
+) -> List[int]:
+    """
+    Replace the contractors assigned to a project
+
+    IDs that don't belong to SUBCONTRACTOR users are ignored.
+
+    Returns:
+        The assigned contractor IDs after the update, ascending
+    """
+    users = models.User.__table__
+    assignments = models.project_assignments
+
+    wanted = set()
+    if contractor_ids:
+        result = await db.execute(
+            select(users.c.id).where(
+                users.c.id.in_(set(contractor_ids)),
+                users.c.user_type == schemas.UserType.SUBCONTRACTOR,
+            )
+        )
+        wanted = set(result.scalars().all())
+
+    result = await db.execute(
+        select(assignments.c.contractor_id).where(assignments.c.project_id == project_id)
+    )
+    current = set(result.scalars().all())
+
+    to_remove = current - wanted
+    if to_remove:
+        await db.execute(
+            delete(assignments).where(
+                assignments.c.project_id == project_id, assignments.c.contractor_id.in_(to_remove)
+            )
+        )
+
+    to_add = wanted - current
+    if to_add:
+        await db.execute(
+            insert(assignments),
+            [{"project_id": project_id, "contractor_id": contractor_id} for contractor_id in to_add],
+        )
+    return sorted(wanted)
+
+def encode_project_cursor(created_at: datetime, id: int) -> str:
+    """Opaque cursor for the last project on a page"""
+    payload = json.dumps([created_at.isoformat(), id]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+def decode_project_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor from `encode_project_cursor`
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+async def attach_project_images(db: AsyncSession, items: List[Dict[str, Any]]) -> None:
+    """
+    Set `images` and `image_variants` on a page of project rows
+
+    Uses one query for the whole page. Variant URLs are None until the
+    background pipeline has rendered them.
+    """
+    images_by_project: Dict[int, List[str]] = {item["id"]: [] for item in items}
+    variants_by_project: Dict[int, List[Dict[str, Any]]] = {item["id"]: [] for item in items}
+    if items:
+        images = models.ProjectImage.__table__
+        variants = models.ProjectImageVariant.__table__
+        result = await db.execute(
+            select(images.c.id, images.c.project_id, images.c.image_url, variants.c.variant, variants.c.image_url)
+            .outerjoin(variants, variants.c.image_id == images.c.id)
+            .where(images.c.project_id.in_(images_by_project))
+            .order_by(images.c.id)
+        )
+        entries: Dict[int, Dict[str, Any]] = {}
+        for image_id, project_id, image_url, variant, variant_url in result.all():
+            entry = entries.get(image_id)
+            if entry is None:
+                entry = entries[image_id] = {"url": image_url, "thumbnail_url": None, "web_url": None}
+                images_by_project[project_id].append(image_url)
+                variants_by_project[project_id].append(entry)
+            if variant is not None:
+                entry[f"{variant}_url"] = variant_url
+
+    for item in items:
+        item["images"] = images_by_project[item["id"]]
+        item["image_variants"] = variants_by_project[item["id"]]
+
+async def list_projects(
+    db: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    project_leader_id: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    List projects newest first with keyset pagination on (created_at, id)
+
+    Filters line up with ix_projects_status_created_at and
+    ix_projects_leader_created_at, so each page is an index range scan.
+
+    Args:
+        db: Database session
+        limit: Page size
+        cursor: `next_cursor` from the previous page
+        status: Only projects with this status
+        project_leader_id: Only projects led by this user
+
+    Returns:
+        The page of projects and the cursor for the next page, if any
+    """
+    projects = models.Project.__table__
+    query = select(
+        projects.c.id,
+        projects.c.title,
+        projects.c.description,
+        projects.c.location,
+        projects.c.status,
+        projects.c.project_leader_id,
+        projects.c.created_at,
+        projects.c.updated_at,
+    )
+
+    if status is not None:
+        query = query.where(projects.c.status == status)
+    if project_leader_id is not None:
+        query = query.where(projects.c.project_leader_id == project_leader_id)
+    if cursor is not None:
+        after_created_at, after_id = decode_project_cursor(cursor)
+        # Written as a range on created_at plus a tie-break so the index is used
+        query = query.where(
+            projects.c.created_at <= after_created_at,
+            or_(
+                projects.c.created_at < after_created_at,
+                and_(projects.c.created_at == after_created_at, projects.c.id < after_id),
+            ),
+        )
+
+    # Fetch one extra row to learn whether there is a next page
+    query = query.order_by(projects.c.created_at.desc(), projects.c.id.desc()).limit(limit + 1)
+    result = await db.execute(query)
+    items = [dict(row) for row in result.mappings().all()]
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_project_cursor(items[-1]["created_at"], items[-1]["id"])
+
+    await attach_project_images(db, items)
+    return items, next_cursor
+
+async def nearby_subcontractors(
+    db: AsyncSession, latitude: float, longitude: float, miles: float, limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Subcontractors within `miles` of a point, nearest first
+
+    Candidates come from geohash range scans over ix_users_geohash; exact
+    distances are then checked with the haversine formula.
+    """
+    subcontractors = models.Subcontractor.__table__
+    users = models.User.__table__
+
+    # Every geohash extending a prefix sorts between the prefix and prefix + "~"
+    cells = or_(*[
+        and_(users.c.geohash >= prefix, users.c.geohash < prefix + "~")
+        for prefix in geo.covering_prefixes(latitude, longitude, miles)
+    ])
+    result = await db.execute(
+        select(
+            subcontractors.c.id,
+            subcontractors.c.user_id,
+            users.c.company_name,
+            users.c.first_name,
+            users.c.last_name,
+            users.c.location,
+            subcontractors.c.hourly_rate,
+            subcontractors.c.has_insurance,
+            users.c.latitude,
+            users.c.longitude,
+        )
+        .select_from(users.join(subcontractors, subcontractors.c.user_id == users.c.id))
+        .where(cells)
+    )
+
+    nearby = []
+    for row in result.mappings():
+        distance = geo.haversine_miles(latitude, longitude, row["latitude"], row["longitude"])
+        if distance <= miles:
+            item = dict(row)
+            del item["latitude"], item["longitude"]
+            item["distance_miles"] = round(distance, 2)
+            nearby.append(item)
+
+    nearby.sort(key=lambda item: item["distance_miles"])
+    return nearby[:limit]
@@ -1,12 +1,213 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from typing import Any, Dict
+import os
+import threading
+import time
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./sql_app.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Async drivers for the sync URLs we accept in DATABASE_URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+# SQLite profile: WAL lets readers proceed while a writer commits
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KIB = int(os.environ.get("SQLITE_CACHE_SIZE_KIB", "65536"))
+
+# Server profile: connection pool sizing
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+
+def _async_url(url: str) -> str:
+    """Derive the async driver URL from a sync DATABASE_URL"""
+    if os.environ.get("ASYNC_DATABASE_URL"):
+        return os.environ["ASYNC_DATABASE_URL"]
+
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        parsed = parsed.set(drivername=ASYNC_DRIVERS[backend])
+    return parsed.render_as_string(hide_password=False)
+
+ASYNC_SQLALCHEMY_DATABASE_URL = _async_url(SQLALCHEMY_DATABASE_URL)
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _timed_pool_class(url: str, metrics: "PoolMetrics"):
+    """
+    The dialect's default pool class, recording how long each checkout takes
+
+    Pool events fire only once a connection has been handed out, so the
+    wait is measured around `connect` instead. It covers waiting for a
+    free connection and opening a new one, and is recorded for every
+    checkout, sync or async, whenever it happens.
+    """
+    parsed = make_url(url)
+    base = parsed.get_dialect().get_pool_class(parsed)
+
+    class TimedPool(base):
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                metrics.record_wait(time.perf_counter() - started)
+
+    TimedPool.__name__ = base.__name__
+    return TimedPool
+
+def _engine_options(url: str, metrics: "PoolMetrics") -> Dict[str, Any]:
+    """
+    Engine keyword arguments for the profile matching the URL
+
+    Args:
+        url: A sync or async database URL
+        metrics: Counters the engine's pool reports checkout waits to
+
+    Returns:
+        Keyword arguments for create_engine/create_async_engine
+    """
+    if _is_sqlite(url):
+        return {"connect_args": {"check_same_thread": False}, "poolclass": _timed_pool_class(url, metrics)}
+
+    return {
+        "poolclass": _timed_pool_class(url, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        # Negative values are interpreted by SQLite as KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+class PoolMetrics:
+    """Checkout/wait counters for a connection pool, fed by pool events"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.waits = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def attach(self, sync_engine) -> None:
+        """Register pool event listeners on a (sync) engine"""
+        event.listen(sync_engine, "connect", self._on_connect)
+        event.listen(sync_engine, "checkout", self._on_checkout)
+        event.listen(sync_engine, "checkin", self._on_checkin)
+        event.listen(sync_engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, seconds: float) -> None:
+        """Record how long a caller waited to get a connection from the pool"""
+        with self._lock:
+            self.waits += 1
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def stats(self, pool) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "pool": pool.__class__.__name__,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "avg_wait_ms": 1000 * self.total_wait_seconds / self.waits if self.waits else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_seconds,
+            }
+        # QueuePool exposes its configured size and current overflow
+        if hasattr(pool, "size") and hasattr(pool, "overflow"):
+            stats["size"] = pool.size()
+            stats["overflow"] = pool.overflow()
+        return stats
+
+pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL, pool_metrics))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+# Used by the FastAPI app so queries never block the event loop
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL, **_engine_options(ASYNC_SQLALCHEMY_DATABASE_URL, async_pool_metrics)
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+if _is_sqlite(SQLALCHEMY_DATABASE_URL):
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+if _is_sqlite(ASYNC_SQLALCHEMY_DATABASE_URL):
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+pool_metrics.attach(engine)
+async_pool_metrics.attach(async_engine.sync_engine)
+
+def pool_stats() -> Dict[str, Any]:
+    """Return pool statistics for both engines"""
+    return {
+        "sync": pool_metrics.stats(engine.pool),
+        "async": async_pool_metrics.stats(async_engine.sync_engine.pool),
+    }
+
+async def get_db():
+    """
+    FastAPI dependency yielding an async database session
+
+    The session checks a connection out on its first query, so handlers
+    hold none while they await anything else.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+Base = declarative_base()
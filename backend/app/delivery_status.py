@@ -0,0 +1,185 @@
+import asyncio
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+
+from sqlalchemy import bindparam, case, or_, update
+from twilio.request_validator import RequestValidator
+
+from . import models
+from .database import AsyncSessionLocal
+
+TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
+
+# Buffered status updates are written at least this often...
+STATUS_FLUSH_INTERVAL = float(os.environ.get('STATUS_FLUSH_INTERVAL_SECONDS', '2'))
+# ...or as soon as this many messages have updates waiting
+STATUS_FLUSH_SIZE = int(os.environ.get('STATUS_FLUSH_SIZE', '500'))
+
+# Progress of a Twilio message; callbacks can arrive out of order, and a
+# status never replaces one further along
+STATUS_RANK = {
+    "accepted": 1,
+    "scheduled": 1,
+    "queued": 2,
+    "sending": 3,
+    "sent": 4,
+    "delivered": 5,
+    "undelivered": 5,
+    "failed": 5,
+    "canceled": 5,
+    "read": 6,
+}
+
+@lru_cache(maxsize=1)
+def _validator(auth_token: str) -> RequestValidator:
+    return RequestValidator(auth_token)
+
+def is_valid_signature(url: str, params: Mapping[str, str], signature: Optional[str]) -> bool:
+    """
+    Check the X-Twilio-Signature of a callback
+
+    Args:
+        url: The full URL Twilio posted to, as Twilio sees it
+        params: The form parameters of the request
+        signature: The X-Twilio-Signature header
+
+    Returns:
+        True if the request was signed with our auth token
+    """
+    if not TWILIO_AUTH_TOKEN or not signature:
+        return False
+    return _validator(TWILIO_AUTH_TOKEN).validate(url, dict(params), signature)
+
+class StatusUpdate(NamedTuple):
+    status: str
+    error_code: Optional[str]
+    rank: int
+    received_at: datetime
+
+class DeliveryStatusBuffer:
+    """
+    Coalesces delivery status callbacks in memory and writes them in batches
+
+    Only the furthest-along status of each message is kept, so the
+    several callbacks Twilio sends per message become one row update.
+    Updates are written every STATUS_FLUSH_INTERVAL seconds, or sooner
+    once STATUS_FLUSH_SIZE messages are waiting, as one executemany
+    UPDATE matched on message SID. Updates buffered when the process
+    stops uncleanly are lost; the message itself is unaffected.
+    """
+
+    def __init__(self, flush_size: int = STATUS_FLUSH_SIZE, flush_interval: float = STATUS_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, StatusUpdate] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._received = 0
+        self._coalesced = 0
+        self._written = 0
+        self._flushes = 0
+
+    def record(self, message_sid: str, status: str, error_code: Optional[str] = None) -> None:
+        """Buffer a status callback"""
+        self._received += 1
+        rank = STATUS_RANK.get(status, 0)
+        current = self._pending.get(message_sid)
+        if current is not None:
+            self._coalesced += 1
+            if current.rank > rank:
+                return
+        self._pending[message_sid] = StatusUpdate(status, error_code or None, rank, datetime.now())
+        if len(self._pending) >= self.flush_size:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """
+        Write the buffered updates
+
+        Returns:
+            Number of messages whose status was written
+        """
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        outbox = models.NotificationOutbox.__table__
+        current_rank = case(STATUS_RANK, value=outbox.c.delivery_status, else_=0)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(outbox)
+                    .where(
+                        outbox.c.message_sid == bindparam("sid"),
+                        # Don't regress a status written by an earlier flush
+                        or_(outbox.c.delivery_status.is_(None), current_rank <= bindparam("rank")),
+                    )
+                    .values(
+                        delivery_status=bindparam("new_status"),
+                        delivery_error_code=bindparam("error_code"),
+                        delivery_updated_at=bindparam("updated_at"),
+                    )
+                    .execution_options(synchronize_session=False),
+                    [
+                        {
+                            "sid": message_sid,
+                            "rank": entry.rank,
+                            "new_status": entry.status,
+                            "error_code": entry.error_code,
+                            "updated_at": entry.received_at,
+                        }
+                        for message_sid, entry in pending.items()
+                    ],
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"Error writing delivery statuses: {e}")
+            # Keep the batch for the next flush unless newer updates have arrived
+            for message_sid, entry in pending.items():
+                current = self._pending.get(message_sid)
+                if current is None or current.rank < entry.rank:
+                    self._pending[message_sid] = entry
+            return 0
+
+        self._written += len(pending)
+        self._flushes += 1
+        return len(pending)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        """Start flushing in the background on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flush and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "received": self._received,
+            "coalesced": self._coalesced,
+            "written": self._written,
+            "flushes": self._flushes,
+        }
+
+# Create a singleton instance
+status_buffer = DeliveryStatusBuffer()
@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Marks a key that isn't cached, as opposed to a cached missing document (None)
+MISSING = object()
+
+class DocumentCache:
+    """
+    Bounded, thread-safe LRU cache of documents with a time-to-live
+
+    Documents that don't exist are cached as None. `invalidate` drops a
+    key and also stops a read that started before it from caching what
+    it fetched, so an update that lands mid-read can't be overwritten by
+    the older copy. Invalidations are remembered per key for the most
+    recent `max_entries` keys; when an older one is forgotten, every read
+    that started before it is refused instead.
+
+    Hit rate and staleness are tracked: the age of each document served
+    from the cache, and how long after a document changed its
+    invalidation arrived.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[Dict[str, Any]], float]]" = OrderedDict()
+        # Generation at which each recently invalidated key was dropped
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._generation = 0
+        # Reads that started before this generation are never cached
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._expired = 0
+            self._evicted = 0
+            self._invalidations = 0
+            self._served_age_total = 0.0
+            self._served_age_max = 0.0
+            self._lag_total = 0.0
+            self._lag_max = 0.0
+            self._lag_count = 0
+
+    @property
+    def generation(self) -> int:
+        """Token to pass to `put` for a read that starts now"""
+        return self._generation
+
+    def get(self, key: Hashable):
+        """
+        Look up a key
+
+        Returns:
+            The cached document (None if cached as missing), or MISSING
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return MISSING
+
+            document, cached_at = entry
+            age = now - cached_at
+            if age > self.ttl:
+                del self._entries[key]
+                self._expired += 1
+                self._misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._served_age_total += age
+            self._served_age_max = max(self._served_age_max, age)
+            return None if document is None else dict(document)
+
+    def put(self, key: Hashable, document: Optional[Dict[str, Any]], generation: int) -> None:
+        """
+        Cache a document read from the server
+
+        Args:
+            key: Cache key
+            document: The document, or None if it doesn't exist
+            generation: `generation` taken before the read started; the
+                document is dropped if the key was invalidated since
+        """
+        with self._lock:
+            if generation < self._floor or self._invalidated.get(key, -1) > generation:
+                return
+            self._entries[key] = (None if document is None else dict(document), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evicted += 1
+
+    def invalidate(self, key: Hashable, changed_at: Optional[float] = None) -> None:
+        """
+        Drop a key
+
+        Args:
+            key: Cache key
+            changed_at: When the document changed (epoch seconds), to measure
+                how late the invalidation is
+        """
+        with self._lock:
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.max_entries:
+                # Without the record, a read of that key from before it could cache a stale copy
+                _, forgotten = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, forgotten)
+
+            if self._entries.pop(key, None) is not None:
+                self._invalidations += 1
+                if changed_at is not None:
+                    lag = max(0.0, time.time() - changed_at)
+                    self._lag_total += lag
+                    self._lag_max = max(self._lag_max, lag)
+                    self._lag_count += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            # Reads in flight may predate the clear, so none of them may be cached
+            self._invalidated.clear()
+            self._entries.clear()
+            self._floor = self._generation
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate, evictions and staleness since the last reset"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "expired": self._expired,
+                "evicted": self._evicted,
+                "invalidations": self._invalidations,
+                "served_age_avg": self._served_age_total / self._hits if self._hits else 0.0,
+                "served_age_max": self._served_age_max,
+                "invalidation_lag_avg": self._lag_total / self._lag_count if self._lag_count else 0.0,
+                "invalidation_lag_max": self._lag_max,
+            }
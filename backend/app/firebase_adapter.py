@@ -1,18 +1,196 @@
+import os
+import threading
+import firebase_admin
 from firebase_admin import firestore
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional
+from .document_cache import MISSING, DocumentCache
+
+# Project fields a reminder run needs; everything else stays on the server
+PROJECT_REMINDER_FIELDS = ['title', 'location', 'description', 'clientName', 'startDate', 'contractors']
+
+# Documents requested per get_all call
+GET_ALL_CHUNK_SIZE = 100
+
+# Firestore allows at most 500 writes in one batch
+MAX_BATCH_WRITES = 500
+
+# Read-through cache of contractor and project documents
+FIRESTORE_CACHE_ENABLED = os.environ.get('FIRESTORE_CACHE_ENABLED', 'true').lower() != 'false'
+FIRESTORE_CACHE_MAX_ENTRIES = int(os.environ.get('FIRESTORE_CACHE_MAX_ENTRIES', '5000'))
+# Upper bound on staleness if a snapshot listener falls behind or drops
+FIRESTORE_CACHE_TTL_SECONDS = float(os.environ.get('FIRESTORE_CACHE_TTL_SECONDS', '300'))
+
+# Collections whose documents are cached and invalidated by snapshot listeners
+CACHED_COLLECTIONS = ('contractors', 'projects')
+
+class NotificationLogWriter:
+    """
+    Buffers notification logs and writes them in batched commits
+
+    Logs are flushed every `batch_size` entries and on exit when used as
+    a context manager. Document IDs are assigned up front, so `add`
+    returns the ID before the write is committed.
+    """
+
+    def __init__(self, db, batch_size: int = MAX_BATCH_WRITES):
+        self.collection = db.collection('notifications')
+        self.db = db
+        self.batch_size = min(batch_size, MAX_BATCH_WRITES)
+        self._pending = []
+
+    def add(self, project_id: str, contractor_id: str, message_sid: Optional[str], status: str = 'sent') -> str:
+        """
+        Queue a notification log
+
+        Returns:
+            The ID the notification document will have
+        """
+        doc_ref = self.collection.document()
+        self._pending.append((doc_ref, {
+            'project_id': project_id,
+            'contractor_id': contractor_id,
+            'message_sid': message_sid,
+            'status': status,
+            'timestamp': firestore.SERVER_TIMESTAMP
+        }))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return doc_ref.id
+
+    def flush(self) -> None:
+        """Write all queued logs"""
+        while self._pending:
+            chunk, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            batch = self.db.batch()
+            for doc_ref, data in chunk:
+                batch.set(doc_ref, data)
+            batch.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
 
 class FirebaseAdapter:
-    """Adapter to interact with Firebase Firestore"""
+    """
+    Adapter to interact with Firebase Firestore
+
+    Contractor and project documents read by ID go through a bounded TTL
+    cache. The first cached read starts `on_snapshot` listeners on those
+    collections, which drop a document from the cache as soon as it
+    changes; the TTL bounds staleness if a listener falls behind. Pass
+    `consistent=True` to read from the server regardless of the cache.
+    """
+
+    def __init__(self, db=None, cache_enabled: bool = FIRESTORE_CACHE_ENABLED):
+        """
+        Initialize the Firestore client
+
+        Args:
+            db: Firestore client to use instead of the default app's, e.g.
+                one pointed at the emulator through FIRESTORE_EMULATOR_HOST
+            cache_enabled: Cache contractor and project documents
+        """
+        self._db = db
+        self.cache = DocumentCache(FIRESTORE_CACHE_MAX_ENTRIES, FIRESTORE_CACHE_TTL_SECONDS) if cache_enabled else None
+        self._watches = {}
+        self._watch_lock = threading.Lock()
+
+    @property
+    def db(self):
+        # Created on first use so importing this module doesn't need an initialized app
+        if self._db is None:
+            try:
+                firebase_admin.get_app()
+            except ValueError:
+                firebase_admin.initialize_app()
+            self._db = firestore.client()
+        return self._db
+
+    def _watch(self) -> None:
+        """Start the snapshot listeners that invalidate cached documents"""
+        if len(self._watches) == len(CACHED_COLLECTIONS):
+            return
+        with self._watch_lock:
+            for collection in CACHED_COLLECTIONS:
+                if collection not in self._watches:
+                    self._watches[collection] = self.db.collection(collection).on_snapshot(self._invalidator(collection))
 
-    def __init__(self):
-        """Initialize the Firestore client"""
-        self.db = firestore.client()
+    def _invalidator(self, collection: str):
+        def on_snapshot(snapshots, changes, read_time):
+            for change in changes:
+                update_time = getattr(change.document, 'update_time', None)
+                self.cache.invalidate(
+                    (collection, change.document.id),
+                    update_time.timestamp() if update_time else None,
+                )
+        return on_snapshot
 
-    def get_projects_starting_tomorrow(self) -> List[Dict[str, Any]]:
+    def _get_documents(self, collection: str, document_ids: Iterable[str], consistent: bool = False) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Get documents by ID, from the cache where possible
+
+        Args:
+            collection: A collection in CACHED_COLLECTIONS
+            document_ids: The document IDs; duplicates are fetched once
+            consistent: Read every document from the server; the results
+                still refresh the cache
+
+        Returns:
+            Each document by ID, or None where it doesn't exist
+        """
+        ids = list(dict.fromkeys(document_ids))
+        documents = {}
+        if self.cache is not None:
+            self._watch()
+            if not consistent:
+                uncached = []
+                for document_id in ids:
+                    document = self.cache.get((collection, document_id))
+                    if document is MISSING:
+                        uncached.append(document_id)
+                    else:
+                        documents[document_id] = document
+                ids = uncached
+            generation = self.cache.generation
+
+        collection_ref = self.db.collection(collection)
+        for start in range(0, len(ids), GET_ALL_CHUNK_SIZE):
+            refs = [collection_ref.document(document_id) for document_id in ids[start:start + GET_ALL_CHUNK_SIZE]]
+            for doc in self.db.get_all(refs):
+                document = None
+                if doc.exists:
+                    document = doc.to_dict()
+                    document['id'] = doc.id
+                documents[doc.id] = document
+                if self.cache is not None:
+                    self.cache.put((collection, doc.id), document, generation)
+        return documents
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit rate and staleness of the document cache"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, "listening": sorted(self._watches), **self.cache.stats()}
+
+    def close(self) -> None:
+        """Stop the snapshot listeners and empty the cache"""
+        with self._watch_lock:
+            for watch in self._watches.values():
+                watch.unsubscribe()
+            self._watches.clear()
+        if self.cache is not None:
+            self.cache.clear()
+
+    def get_projects_starting_tomorrow(self, fields: Optional[List[str]] = PROJECT_REMINDER_FIELDS) -> List[Dict[str, Any]]:
         """
         Get projects that are starting tomorrow
 
+        Args:
+            fields: Fields to fetch, or None for whole documents
+
         Returns:
             List of project documents
         """
@@ -23,6 +201,8 @@ class FirebaseAdapter:
         # Query Firestore for projects with startDate matching tomorrow
         projects_ref = self.db.collection('projects')
         query = projects_ref.where('startDate', '==', tomorrow_str)
+        if fields is not None:
+            query = query.select(fields)
 
         # Execute query
         projects = []
@@ -33,32 +213,105 @@ class FirebaseAdapter:
 
         return projects
 
-    def get_contractor_by_id(self, contractor_id: str) -> Optional[Dict[str, Any]]:
+    def get_contractor_by_id(self, contractor_id: str, consistent: bool = False) -> Optional[Dict[str, Any]]:
         """
         Get contractor data by ID
 
         Args:
             contractor_id: The contractor's document ID
+            consistent: Bypass the cache and read from the server
 
         Returns:
             Contractor document or None if not found
         """
-        doc_ref = self.db.collection('contractors').document(contractor_id)
-        doc = doc_ref.get()
+        return self._get_documents('contractors', [contractor_id], consistent)[contractor_id]
+
+    def get_project_by_id(self, project_id: str, consistent: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get project data by ID
 
-        if doc.exists:
-            contractor_data = doc.to_dict()
-            contractor_data['id'] = doc.id
-            return contractor_data
+        Args:
+            project_id: The project's document ID
+            consistent: Bypass the cache and read from the server
 
-        return None
+        Returns:
+            Project document or None if not found
+        """
+        return self._get_documents('projects', [project_id], consistent)[project_id]
 
-    def get_contractors_for_project(self, project_id: str) -> List[Dict[str, Any]]:
+    def get_contractors_by_ids(
+        self,
+        contractor_ids: Iterable[str],
+        fields: Optional[List[str]] = None,
+        consistent: bool = False,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get many contractors with batched reads
+
+        Whole documents come from the cache where possible; projected
+        reads always go to the server.
+
+        Args:
+            contractor_ids: The contractors' document IDs; duplicates are fetched once
+            fields: Fields to fetch, or None for whole documents
+            consistent: Bypass the cache and read from the server
+
+        Returns:
+            Contractor documents by ID; IDs with no document are left out
+        """
+        if fields is None:
+            documents = self._get_documents('contractors', contractor_ids, consistent)
+            return {contractor_id: document for contractor_id, document in documents.items() if document is not None}
+
+        collection = self.db.collection('contractors')
+        ids = list(dict.fromkeys(contractor_ids))
+
+        contractors = {}
+        for start in range(0, len(ids), GET_ALL_CHUNK_SIZE):
+            refs = [collection.document(contractor_id) for contractor_id in ids[start:start + GET_ALL_CHUNK_SIZE]]
+            for doc in self.db.get_all(refs, field_paths=fields):
+                if doc.exists:
+                    contractor_data = doc.to_dict()
+                    contractor_data['id'] = doc.id
+                    contractors[doc.id] = contractor_data
+        return contractors
+
+    def get_contractors_for_projects(self, projects: List[Dict[str, Any]], consistent: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get the contractors assigned to each of several projects
+
+        All contractors are fetched together, so this costs one round trip
+        per GET_ALL_CHUNK_SIZE distinct contractors however many projects
+        there are.
+
+        Args:
+            projects: Project documents with 'id' and 'contractors' fields,
+                e.g. from get_projects_starting_tomorrow
+            consistent: Bypass the cache and read from the server
+
+        Returns:
+            Contractor documents for each project ID, in assignment order
+        """
+        contractors = self.get_contractors_by_ids(
+            (contractor_id for project in projects for contractor_id in project.get('contractors') or []),
+            consistent=consistent,
+        )
+        return {
+            project['id']: [
+                contractors[contractor_id]
+                for contractor_id in project.get('contractors') or []
+                if contractor_id in contractors
+            ]
+            for project in projects
+        }
+
+    def get_contractors_for_project(self, project_id: str, consistent: bool = False) -> List[Dict[str, Any]]:
         """
         Get contractors assigned to a project
 
         Args:
             project_id: The project's document ID
+            consistent: Bypass the cache and read from the server
 
         Returns:
             List of contractor documents
@@ -67,21 +320,11 @@ class FirebaseAdapter:
         # document that contains an array of contractor IDs
         # Adjust based on your actual data model
 
-        project_ref = self.db.collection('projects').document(project_id)
-        project = project_ref.get()
-
-        contractors = []
-        if project.exists:
-            project_data = project.to_dict()
+        project = self.get_project_by_id(project_id, consistent)
+        if project is None:
+            return []
 
-            # If the project has assigned contractors
-            if 'contractors' in project_data and project_data['contractors']:
-                for contractor_id in project_data['contractors']:
-                    contractor = self.get_contractor_by_id(contractor_id)
-                    if contractor:
-                        contractors.append(contractor)
-
-        return contractors
+        return self.get_contractors_for_projects([project], consistent)[project_id]
 
     def log_notification(self, project_id: str, contractor_id: str, message_sid: str, status: str = 'sent') -> str:
         """
@@ -109,5 +352,16 @@ class FirebaseAdapter:
         doc_ref = notifications_ref.add(notification_data)
         return doc_ref[1].id
 
+    def notification_log_writer(self, batch_size: int = MAX_BATCH_WRITES) -> NotificationLogWriter:
+        """
+        Get a writer that logs notifications in batched commits
+
+        Use it as a context manager so the last partial batch is written:
+
+            with firebase_adapter.notification_log_writer() as logs:
+                logs.add(project_id, contractor_id, message_sid)
+        """
+        return NotificationLogWriter(self.db, batch_size)
+
 # Create a singleton instance
 firebase_adapter = FirebaseAdapter()
\ No newline at end of file
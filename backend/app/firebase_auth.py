@@ -2,6 +2,13 @@ import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import threading
+import time
 import os
 import json
 
@@ -33,16 +40,120 @@ else:
         raise FileNotFoundError(f"Firebase credentials not found in environment or at {cred_path}")
 
 # Initialize Firebase Admin with credentials
-firebase_admin.initialize_app(cred)
+firebase_app = firebase_admin.initialize_app(cred)
 
 security = HTTPBearer()
 
+# Upper bound on the number of decoded tokens kept in memory
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', '4096'))
+
+class VerifiedTokenCache:
+    """Bounded LRU cache of decoded ID tokens that expire at the token's `exp` claim"""
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a decoded token
+
+        Args:
+            key: Hash of the raw ID token
+
+        Returns:
+            The decoded claims, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, decoded_token = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decoded_token
+
+    def put(self, key: str, decoded_token: Dict[str, Any]) -> None:
+        """
+        Store a decoded token until its `exp` claim
+
+        Args:
+            key: Hash of the raw ID token
+            decoded_token: Claims returned by `auth.verify_id_token`
+        """
+        expires_at = decoded_token.get('exp')
+        if not expires_at or expires_at <= time.time():
+            return
+
+        with self._lock:
+            self._entries[key] = (expires_at, decoded_token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for the metrics endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# Create a singleton instance
+token_cache = VerifiedTokenCache()
+
+# Verifications currently running in the thread pool, keyed like the cache, so a
+# burst of requests carrying the same new token only verifies it once
+_inflight_verifications: Dict[str, asyncio.Future] = {}
+
+def _token_key(token: str) -> str:
+    """Hash the raw token so the cache never holds bearer credentials"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+async def _verify_uncached(key: str, token: str) -> Dict[str, Any]:
+    future = _inflight_verifications.get(key)
+    if future is None:
+        # RSA verification (and any certificate refresh) is blocking work
+        future = asyncio.ensure_future(run_in_threadpool(auth.verify_id_token, token))
+        _inflight_verifications[key] = future
+        future.add_done_callback(lambda _: _inflight_verifications.pop(key, None))
+
+    # Shield so a disconnecting client does not cancel a verification others await
+    decoded_token = await asyncio.shield(future)
+    token_cache.put(key, decoded_token)
+    return decoded_token
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
+    key = _token_key(credentials.credentials)
+    decoded_token = token_cache.get(key)
+    if decoded_token is not None:
+        return decoded_token
+
     try:
-        decoded_token = auth.verify_id_token(credentials.credentials)
+        decoded_token = await _verify_uncached(key, credentials.credentials)
         return decoded_token
     except Exception as e:
         raise HTTPException(
             status_code=401,
             detail=f"Invalid authentication credentials: {e}"
-        )
\ No newline at end of file
+        )
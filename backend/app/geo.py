@@ -0,0 +1,259 @@
+import csv
+import gzip
+import math
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Curated centroids for major US cities, shipped with the app
+CITY_CENTROIDS_PATH = os.path.join(DATA_DIR, 'us_city_centroids.csv')
+
+# ZIP centroids with timezones for every active US ZIP code, shipped with the
+# app (see data/README.md). Override with a newer file: the Census ZCTA
+# Gazetteer file (tab-separated, with GEOID, INTPTLAT and INTPTLONG columns)
+# or a CSV with zip,latitude,longitude[,timezone]; either may be gzipped.
+ZIP_CENTROIDS_PATH = os.environ.get('GEO_ZIP_CENTROIDS_PATH', os.path.join(DATA_DIR, 'us_zip_centroids.csv.gz'))
+
+EARTH_RADIUS_MILES = 3958.8
+GEOHASH_PRECISION = 9
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+_ZIP = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+_STATE_BEFORE = re.compile(r'(?:^|[^A-Za-z])([A-Za-z]{2})[\s,]*$')
+_COUNTRY_AFTER = re.compile(r'^[\s,.]*(?:(?:USA|US|United States)[\s.]*)?$', re.IGNORECASE)
+
+# Postal abbreviations of US states, DC and territories
+US_STATES = frozenset(
+    'AL AK AZ AR CA CO CT DE DC FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT NE NV NH NJ '
+    'NM NY NC ND OH OK OR PA RI SC SD TN TX UT VT VA WA WV WI WY AS GU MP PR VI'.split()
+)
+_STATE = re.compile(r'^([A-Za-z]{2})\b')
+_CITY_STATE = re.compile(r'^(.*?)[,\s]+([A-Za-z]{2})(?:\s+\d{5}(?:-\d{4})?)?$')
+
+class Centroid(NamedTuple):
+    latitude: float
+    longitude: float
+    timezone: Optional[str] = None
+
+def _open_text(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='', encoding='utf-8')
+    return open(path, newline='', encoding='utf-8')
+
+class CentroidTable:
+    """
+    Offline lookup of ZIP and city centroids
+
+    Loading the ZIP table takes a fraction of a second, so the app calls
+    `load` off the event loop at startup; other callers load on first use.
+    """
+
+    def __init__(self, city_path: str = CITY_CENTROIDS_PATH, zip_path: Optional[str] = ZIP_CENTROIDS_PATH):
+        self.city_path = city_path
+        self.zip_path = zip_path
+        self._cities: Optional[Dict[Tuple[str, str], Centroid]] = None
+        self._zips: Optional[Dict[str, Centroid]] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Load both tables unless they already are"""
+        if self._cities is None:
+            with self._lock:
+                if self._cities is None:
+                    self._load()
+
+    def _load(self) -> None:
+        cities = {}
+        with open(self.city_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                cities[(row['city'].lower(), row['state'].upper())] = Centroid(
+                    float(row['latitude']), float(row['longitude']), row.get('timezone') or None
+                )
+
+        zips = {}
+        if self.zip_path and os.path.exists(self.zip_path):
+            with _open_text(self.zip_path) as f:
+                delimiter = '\t' if '.txt' in os.path.basename(self.zip_path) else ','
+                reader = csv.DictReader(f, delimiter=delimiter)
+                reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+                for row in reader:
+                    code = row.get('GEOID') or row.get('zip')
+                    latitude = row.get('INTPTLAT') or row.get('latitude')
+                    longitude = row.get('INTPTLONG') or row.get('longitude')
+                    if code and latitude and longitude:
+                        zips[code.strip().zfill(5)] = Centroid(float(latitude), float(longitude), row.get('timezone') or None)
+            print(f"Loaded {len(zips)} ZIP centroids from {self.zip_path}")
+        elif self.zip_path:
+            print(f"Warning: ZIP centroids not found at {self.zip_path}; geocoding by city only")
+
+        # Cities last: load() checks it to see whether both tables are ready
+        self._zips = zips
+        self._cities = cities
+
+    def zip_centroid(self, code: str) -> Optional[Centroid]:
+        self.load()
+        return self._zips.get(code)
+
+    def city_centroid(self, city: str, state: str) -> Optional[Centroid]:
+        self.load()
+        return self._cities.get((city.strip().lower(), state.upper()))
+
+    def nearest_city(self, latitude: float, longitude: float) -> Optional[Centroid]:
+        self.load()
+        return min(
+            self._cities.values(),
+            key=lambda city: haversine_miles(latitude, longitude, city.latitude, city.longitude),
+            default=None,
+        )
+
+# Create a singleton instance
+centroids = CentroidTable()
+
+def _city_state_candidates(location: str) -> Iterable[Tuple[str, str]]:
+    # "123 Main St, New York, NY 10001" -> ("New York", "NY")
+    parts = [part.strip() for part in location.split(',') if part.strip()]
+    for i in range(len(parts) - 1):
+        match = _STATE.match(parts[i + 1])
+        if match:
+            yield parts[i], match.group(1)
+    # "Austin TX" / "Austin, TX 78701"
+    match = _CITY_STATE.match(location.strip())
+    if match:
+        yield match.group(1).split(',')[-1], match.group(2)
+
+def _zip_candidates(location: str) -> List[str]:
+    # A five-digit number is only a ZIP after the state ("Houston, TX 77042")
+    # or at the end of the string ("77042"); house numbers such as
+    # "10001 Westheimer Rd" are not. The last such number wins.
+    codes = []
+    for match in _ZIP.finditer(location):
+        state = _STATE_BEFORE.search(location[:match.start()])
+        if (state and state.group(1).upper() in US_STATES) or _COUNTRY_AFTER.match(location[match.end():]):
+            codes.append(match.group(1))
+    return codes[::-1]
+
+def geocode(location: Optional[str]) -> Optional[Centroid]:
+    """
+    Resolve a free-text location to a centroid
+
+    A ZIP code after the state or at the end of the string wins when it
+    is in the ZIP table; otherwise the "City, ST" part of the string is
+    looked up in the city table. Other five-digit numbers, such as house
+    numbers, are ignored.
+
+    Args:
+        location: Free-text location as entered by users
+
+    Returns:
+        The centroid, or None if nothing in the string is recognised
+    """
+    if not location:
+        return None
+
+    for code in _zip_candidates(location):
+        centroid = centroids.zip_centroid(code)
+        if centroid:
+            return centroid
+
+    for city, state in _city_state_candidates(location):
+        centroid = centroids.city_centroid(city, state)
+        if centroid:
+            return centroid
+
+    return None
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if coordinate >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+def location_columns(location: Optional[str]) -> Dict[str, Optional[object]]:
+    """Column values for latitude, longitude and geohash derived from a location"""
+    centroid = geocode(location)
+    if centroid is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    return {
+        'latitude': centroid.latitude,
+        'longitude': centroid.longitude,
+        'geohash': geohash_encode(centroid.latitude, centroid.longitude),
+    }
+
+def timezone_for(location: Optional[str]) -> Optional[str]:
+    """
+    IANA timezone of a free-text location
+
+    Centroids without a timezone, such as those from the Census ZCTA
+    file, borrow the timezone of the nearest city in the city table.
+    """
+    centroid = geocode(location)
+    if centroid is None:
+        return None
+    if centroid.timezone:
+        return centroid.timezone
+    nearest = centroids.nearest_city(centroid.latitude, centroid.longitude)
+    return nearest.timezone if nearest else None
+
+def haversine_miles(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two coordinates in miles"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+def _cell_size_miles(precision: int, latitude: float) -> Tuple[float, float]:
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = math.floor(5 * precision / 2)
+    height = 180.0 / 2 ** lat_bits * 69.0
+    width = 360.0 / 2 ** lng_bits * 69.0 * max(math.cos(math.radians(latitude)), 0.01)
+    return height, width
+
+def covering_prefixes(latitude: float, longitude: float, radius_miles: float) -> List[str]:
+    """
+    Geohash prefixes whose cells together cover a circle
+
+    Uses the finest precision whose cells are at least as large as the
+    radius, so the center cell and its eight neighbours contain the circle.
+    """
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _cell_size_miles(candidate, latitude)
+        if height >= radius_miles and width >= radius_miles:
+            precision = candidate
+            break
+
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = math.floor(5 * precision / 2)
+    d_lat = 180.0 / 2 ** lat_bits
+    d_lng = 360.0 / 2 ** lng_bits
+
+    prefixes = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            lat = max(min(latitude + i * d_lat, 90.0), -90.0)
+            lng = (longitude + j * d_lng + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(lat, lng, precision))
+    return sorted(prefixes)
@@ -0,0 +1,188 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from . import crud, models
+from .database import AsyncSessionLocal
+from .uploads import UPLOAD_DIR, UPLOAD_URL_PREFIX
+
+# name -> (max width, max height, WebP quality); images are never upscaled
+VARIANTS = {
+    "thumbnail": (320, 320, 70),
+    "web": (1600, 1600, 80),
+}
+
+_DRAFT_SIZE = (
+    max(width for width, _, _ in VARIANTS.values()),
+    max(height for _, height, _ in VARIANTS.values()),
+)
+
+# Worker processes used to render variants
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Images loaded per query when backfilling variants for older uploads
+BACKFILL_BATCH_SIZE = 100
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Spawned rather than forked, since the server process runs threads
+        _executor = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next render starts a fresh one"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    # Its pending renders have already failed, so nothing is left to cancel
+    executor.shutdown(wait=False)
+
+def shutdown() -> None:
+    """Stop the worker processes, if they were started"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _render(source_path: str, output_stem: str) -> Dict[str, Dict[str, int]]:
+    """
+    Write every variant of one image as `<output_stem>_<variant>.webp`
+
+    Runs in a worker process. Variants that already exist are reused, which
+    is safe because originals are stored under their content hash.
+
+    Returns:
+        Width, height and size in bytes of each variant, keyed by name
+    """
+    from PIL import Image, ImageOps
+
+    results = {}
+    original = None
+    try:
+        for name, (max_width, max_height, quality) in VARIANTS.items():
+            path = f"{output_stem}_{name}.webp"
+            if not os.path.exists(path):
+                if original is None:
+                    source = Image.open(source_path)
+                    # Let the JPEG decoder downscale while decoding
+                    source.draft("RGB", _DRAFT_SIZE)
+                    original = ImageOps.exif_transpose(source)
+                    if original.mode not in ("RGB", "RGBA"):
+                        original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+                image = original.copy()
+                image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                image.save(temp_path, "WEBP", quality=quality, method=4)
+                os.replace(temp_path, path)
+
+            with Image.open(path) as variant:
+                results[name] = {
+                    "width": variant.width,
+                    "height": variant.height,
+                    "size_bytes": os.path.getsize(path),
+                }
+    finally:
+        if original is not None:
+            original.close()
+    return results
+
+def _local_path(image_url: str) -> Optional[str]:
+    prefix = f"{UPLOAD_URL_PREFIX}/"
+    if not image_url.startswith(prefix):
+        return None
+    return image_url[len(prefix):]
+
+async def _render_in_pool(source_path: str, output_stem: str) -> Dict[str, Dict[str, int]]:
+    """
+    Run `_render` on the process pool, retrying once on a fresh pool
+
+    A worker that dies (killed for memory, say) breaks the whole pool and
+    fails every render queued on it, so the pool is replaced rather than
+    failing every later upload too.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = _get_executor()
+        try:
+            return await loop.run_in_executor(executor, _render, source_path, output_stem)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            if attempt:
+                raise
+
+async def generate_variants(images: List[Tuple[int, str]]) -> None:
+    """
+    Render and record the variants of uploaded project images
+
+    Rendering runs on the process pool; this coroutine only waits for the
+    results and writes the variant rows. Failures, including a broken
+    pool, are logged per image.
+
+    Args:
+        images: (ProjectImage id, image_url) pairs
+    """
+    jobs = []
+    for image_id, image_url in images:
+        relative_path = _local_path(image_url)
+        if relative_path is None:
+            continue
+        relative_stem = os.path.splitext(relative_path)[0]
+        jobs.append((image_id, relative_stem, _render_in_pool(
+            os.path.join(UPLOAD_DIR, relative_path), os.path.join(UPLOAD_DIR, relative_stem)
+        )))
+
+    results = await asyncio.gather(*(render for _, _, render in jobs), return_exceptions=True)
+
+    rows = []
+    for (image_id, relative_stem, _), rendered in zip(jobs, results):
+        if isinstance(rendered, BaseException):
+            print(f"Error generating variants for image {image_id}: {rendered}")
+            continue
+
+        for name, info in rendered.items():
+            rows.append({
+                "image_id": image_id,
+                "variant": name,
+                "image_url": f"{UPLOAD_URL_PREFIX}/{relative_stem}_{name}.webp",
+                **info,
+            })
+
+    if rows:
+        async with AsyncSessionLocal() as db:
+            await db.execute(crud.insert_ignoring_conflicts(db, models.ProjectImageVariant.__table__), rows)
+            await db.commit()
+
+async def backfill_variants() -> None:
+    """Generate variants for images uploaded before the pipeline existed"""
+    images = models.ProjectImage.__table__
+    variants = models.ProjectImageVariant.__table__
+    after_id = 0
+    try:
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(images.c.id, images.c.image_url)
+                    .outerjoin(variants, variants.c.image_id == images.c.id)
+                    .where(images.c.id > after_id, variants.c.id.is_(None))
+                    .order_by(images.c.id)
+                    .limit(BACKFILL_BATCH_SIZE)
+                )
+                batch = [tuple(row) for row in result.all()]
+            if not batch:
+                return
+
+            await generate_variants(batch)
+            after_id = batch[-1][0]
+    except Exception as e:
+        print(f"Error backfilling image variants: {e}")
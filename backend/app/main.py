@@ -1,15 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends, Security, Form, File, UploadFile
-from sqlalchemy.orm import Session
-from . import models, schemas
-from .database import SessionLocal, engine
-from .firebase_auth import verify_token
-from typing import List
+from fastapi import FastAPI, HTTPException, Depends, Security, Form, File, UploadFile, BackgroundTasks, Query, Request
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud, geo, image_variants, models, schemas, search
+from .database import AsyncSessionLocal, async_engine, get_db, pool_stats
+from .delivery_status import is_valid_signature, status_buffer
+from .firebase_auth import verify_token, token_cache
+from .contractor_import import import_jobs, spool_upload, run_import
+from .migrations import migrate_async
+from .matching import matching_engine
+from .skill_catalog import skill_catalog
+from .sms_dispatcher import TWILIO_STATUS_CALLBACK_URL
+from .sms_replies import TWILIO_INBOUND_URL, handle_reply
+from .uploads import UPLOAD_DIR, UPLOAD_URL_PREFIX, UploadFiles, UploadSizeLimit, store_images
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-import os
-import uuid
+from twilio.twiml.messaging_response import MessagingResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
-
-models.Base.metadata.create_all(bind=engine)
+import asyncio
+import os
 
 app = FastAPI()
 
@@ -25,85 +35,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Oversized image uploads are refused before they are spooled to disk
+app.add_middleware(UploadSizeLimit, paths=["/projects"])
+
+# Uploaded images and their variants; the directory is created at startup
+app.mount(UPLOAD_URL_PREFIX, UploadFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
 
 @app.get("/health", response_model=dict)
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_model=dict)
+async def metrics(token: dict = Depends(verify_token)):
+    # Internal counters; only signed-in users may read them
+    return {
+        "auth_token_cache": token_cache.stats(),
+        "database_pool": pool_stats(),
+        "delivery_status": status_buffer.stats(),
+    }
+
+# Browsers and CDNs may reuse the catalog briefly, then revalidate with the ETag
+SKILLS_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+@app.get("/skills", response_model=List[schemas.Skill])
+async def list_skills(request: Request):
+    # Served from the in-process catalog; the database is only read on a miss
+    skills = await skill_catalog.skills()
+    headers = {"ETag": skill_catalog.etag, "Cache-Control": SKILLS_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), skill_catalog.etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(skills, headers=headers)
+
 @app.post("/project-leaders/", response_model=schemas.ProjectLeader)
 async def create_project_leader(
     project_leader: schemas.ProjectLeaderCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: dict = Depends(verify_token)
 ):
     try:
-        # Check if user already exists
-        existing_user = db.query(models.User).filter(
-            models.User.firebase_uid == project_leader.user.firebase_uid
-        ).first()
-
-        if existing_user:
-            # Update existing user
-            for key, value in project_leader.user.dict().items():
-                setattr(existing_user, key, value)
-            db_user = existing_user
-        else:
-            # Create new user
-            db_user = models.User(**project_leader.user.dict())
-            db.add(db_user)
-
-        db.commit()
-        db.refresh(db_user)
-
-        # Check if project leader already exists
-        db_project_leader = db.query(models.ProjectLeader).filter(
-            models.ProjectLeader.user_id == db_user.id
-        ).first()
-
-        if not db_project_leader:
-            db_project_leader = models.ProjectLeader(user_id=db_user.id)
-            db.add(db_project_leader)
-
-        # Update skills
-        skills = db.query(models.Skill).filter(
-            models.Skill.id.in_(project_leader.skill_ids)
-        ).all()
-        db_project_leader.skills = skills
-
-        db.commit()
-        db.refresh(db_project_leader)
+        # Upsert user, project leader and skill links in one transaction
+        db_project_leader = await crud.upsert_project_leader(db, project_leader)
+        await db.commit()
         return db_project_leader
 
+    except crud.PhoneNumberInUse as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print("Error creating/updating project leader:", str(e))
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/skills/", response_model=schemas.Skill)
 async def create_skill(
     skill: schemas.SkillCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: dict = Depends(verify_token)
 ):
     # You can access user info from token
     # token['uid'] contains Firebase UID
     db_skill = models.Skill(**skill.dict())
     db.add(db_skill)
-    db.commit()
-    db.refresh(db_skill)
+    await db.commit()
+    await db.refresh(db_skill)
+    skill_catalog.invalidate()
     return db_skill
 
 @app.post("/subcontractors/", response_model=schemas.Subcontractor)
 async def create_subcontractor(
     subcontractor: schemas.SubcontractorCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: dict = Depends(verify_token)
 ):
     try:
@@ -113,72 +120,71 @@ async def create_subcontractor(
 
         print("Received subcontractor data:", subcontractor.dict())
 
-        # Check if user already exists
-        existing_user = db.query(models.User).filter(
-            models.User.firebase_uid == subcontractor.user.firebase_uid
-        ).first()
-
-        if existing_user:
-            # Update existing user
-            for key, value in subcontractor.user.dict().items():
-                setattr(existing_user, key, value)
-            db_user = existing_user
-        else:
-            # Create new user
-            db_user = models.User(**subcontractor.user.dict())
-            db.add(db_user)
-
-        db.commit()
-        db.refresh(db_user)
-
-        # Check if subcontractor already exists
-        db_subcontractor = db.query(models.Subcontractor).filter(
-            models.Subcontractor.user_id == db_user.id
-        ).first()
-
-        if not db_subcontractor:
-            db_subcontractor = models.Subcontractor(
-                user_id=db_user.id,
-                hourly_rate=subcontractor.hourly_rate,
-                has_insurance=subcontractor.has_insurance
-            )
-            db.add(db_subcontractor)
-
-        else:
-            # Update existing subcontractor
-            db_subcontractor.hourly_rate = subcontractor.hourly_rate
-            db_subcontractor.has_insurance = subcontractor.has_insurance
-
-        # Update skills
-        skills = db.query(models.Skill).filter(
-            models.Skill.id.in_(subcontractor.skill_ids)
-        ).all()
-        db_subcontractor.skills = skills
-
-        db.commit()
-        db.refresh(db_subcontractor)
+        # Upsert user, subcontractor and skill links in one transaction
+        db_subcontractor = await crud.upsert_subcontractor(db, subcontractor)
+        await db.commit()
+        matching_engine.mark_dirty([db_subcontractor.id])
         return db_subcontractor
 
+    except crud.PhoneNumberInUse as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         print("Error creating/updating subcontractor:", str(e))
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Internal Server Error: {str(e)}"
         )
 
+@app.post("/subcontractors/import", response_model=schemas.ContractorImportJob, status_code=202)
+async def import_subcontractors(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    result = await db.execute(select(models.User).filter(models.User.firebase_uid == token['uid']))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if user.user_type != "PROJECT_LEADER":
+        raise HTTPException(status_code=403, detail="Only project leaders can import contractors")
+
+    # The CSV is parsed and written in batches after the response is sent;
+    # poll the returned job for progress and per-row errors
+    job = import_jobs.create(user.id)
+    path = await spool_upload(file)
+    background_tasks.add_task(run_import, job, path, user.id)
+    return job
+
+@app.get("/subcontractors/import/{job_id}", response_model=schemas.ContractorImportJob)
+async def get_subcontractor_import(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    result = await db.execute(select(models.User.id).filter(models.User.firebase_uid == token['uid']))
+    user_id = result.scalar_one_or_none()
+    job = import_jobs.get(job_id, user_id) if user_id is not None else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
 @app.on_event("startup")
 async def startup_db_client():
-    # Create database tables
-    models.Base.metadata.create_all(bind=engine)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+    # Load the geocoding tables before the first request that geocodes
+    await run_in_threadpool(geo.centroids.load)
+
+    # Create or upgrade database tables
+    await migrate_async(async_engine)
 
     # Add default skills if they don't exist
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
-        # Check if skills exist
-        existing_skills = db.query(models.Skill).all()
-        skill_names = [skill.name for skill in existing_skills]
-
         # Define default skills
         default_skills = [
             {"name": "Plumbing", "description": "Installation and repair of pipes and fixtures"},
@@ -195,24 +201,74 @@ async def startup_db_client():
             {"name": "Gutters", "description": "Gutter installation and maintenance"},
         ]
 
-        # Add skills that don't exist
-        for skill in default_skills:
-            if skill["name"] not in skill_names:
-                db_skill = models.Skill(name=skill["name"], description=skill["description"])
-                db.add(db_skill)
+        # Skills that already exist are skipped by the unique name constraint
+        await db.execute(crud.insert_ignoring_conflicts(db, models.Skill.__table__), default_skills)
+        await db.commit()
 
-        db.commit()
+        # Warm the catalog so the first registration doesn't pay for it
+        skill_catalog.invalidate()
+        await skill_catalog.skills(db)
     except Exception as e:
         print(f"Error adding default skills: {e}")
     finally:
-        db.close()
+        await db.close()
+
+    # Render variants for images uploaded before the pipeline existed
+    app.state.variant_backfill = asyncio.create_task(image_variants.backfill_variants())
+
+    # Write buffered delivery status callbacks in the background
+    status_buffer.start()
+
+@app.on_event("shutdown")
+async def shutdown_image_workers():
+    image_variants.shutdown()
+
+@app.on_event("shutdown")
+async def flush_delivery_statuses():
+    await status_buffer.stop()
+
+@app.post("/twilio/status", status_code=204)
+async def twilio_status_callback(request: Request):
+    """Twilio message status callback; statuses are buffered and written in batches"""
+    params = {key: value for key, value in (await request.form()).items()}
+
+    # Behind a proxy the URL we see differs from the one Twilio signed
+    url = TWILIO_STATUS_CALLBACK_URL or str(request.url)
+    if not is_valid_signature(url, params, request.headers.get("X-Twilio-Signature")):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+    message_sid = params.get("MessageSid")
+    status = params.get("MessageStatus")
+    if not message_sid or not status:
+        raise HTTPException(status_code=400, detail="MessageSid and MessageStatus are required")
+
+    status_buffer.record(message_sid, status, params.get("ErrorCode"))
+    return Response(status_code=204)
+
+@app.post("/twilio/inbound")
+async def twilio_inbound_sms(request: Request, db: AsyncSession = Depends(get_db)):
+    """Twilio incoming message webhook; routes contractors' confirm/decline replies"""
+    params = {key: value for key, value in (await request.form()).items()}
+
+    url = TWILIO_INBOUND_URL or str(request.url)
+    if not is_valid_signature(url, params, request.headers.get("X-Twilio-Signature")):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+    reply = await handle_reply(db, params.get("From", ""), params.get("Body"))
+    await db.commit()
+
+    twiml = MessagingResponse()
+    if reply:
+        twiml.message(reply)
+    return Response(content=str(twiml), media_type="application/xml")
 
 @app.get("/users/profile", response_model=schemas.UserProfile)
 async def get_user_profile(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: dict = Depends(verify_token)
 ):
-    user = db.query(models.User).filter(models.User.firebase_uid == token['uid']).first()
+    result = await db.execute(select(models.User).filter(models.User.firebase_uid == token['uid']))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -231,9 +287,10 @@ async def get_user_profile(
 
     # Add hourly rate for subcontractors
     if user.user_type == "SUBCONTRACTOR":
-        subcontractor = db.query(models.Subcontractor).filter(
+        result = await db.execute(select(models.Subcontractor).filter(
             models.Subcontractor.user_id == user.id
-        ).first()
+        ))
+        subcontractor = result.scalars().first()
         if subcontractor:
             profile_data["hourly_rate"] = subcontractor.hourly_rate
 
@@ -242,25 +299,33 @@ async def get_user_profile(
 @app.put("/users/profile", response_model=schemas.UserProfile)
 async def update_user_profile(
     profile_update: schemas.UserProfileUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: dict = Depends(verify_token)
 ):
-    user = db.query(models.User).filter(models.User.firebase_uid == token['uid']).first()
+    result = await db.execute(select(models.User).filter(models.User.firebase_uid == token['uid']))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Update user location
+    # Update user location and its geocoded coordinates
     user.location = profile_update.location
+    for key, value in geo.location_columns(profile_update.location).items():
+        setattr(user, key, value)
 
     # Update hourly rate for subcontractors
-    if user.user_type == "SUBCONTRACTOR" and profile_update.hourly_rate is not None:
-        subcontractor = db.query(models.Subcontractor).filter(
+    subcontractor = None
+    if user.user_type == "SUBCONTRACTOR":
+        result = await db.execute(select(models.Subcontractor).filter(
             models.Subcontractor.user_id == user.id
-        ).first()
-        if subcontractor:
+        ))
+        subcontractor = result.scalars().first()
+        if subcontractor and profile_update.hourly_rate is not None:
             subcontractor.hourly_rate = profile_update.hourly_rate
 
-    db.commit()
+    await db.commit()
+    if subcontractor:
+        # Location and rate feed the matching snapshot
+        matching_engine.mark_dirty([subcontractor.id])
 
     # Return updated profile
     return {
@@ -272,32 +337,41 @@ async def update_user_profile(
         "company_name": user.company_name,
         "user_type": user.user_type,
         "location": user.location,
-        "hourly_rate": subcontractor.hourly_rate if user.user_type == "SUBCONTRACTOR" and 'subcontractor' in locals() else None
+        "hourly_rate": subcontractor.hourly_rate if subcontractor else None
     }
 
 @app.post("/projects", response_model=schemas.Project)
 async def create_project(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     description: str = Form(None),
     location: str = Form(None),
     status: str = Form(...),
+    skill_ids: List[int] = Form([]),
     images: List[UploadFile] = File([]),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     token: dict = Depends(verify_token)
 ):
     # Check if user exists and is a project leader
-    user = db.query(models.User).filter(models.User.firebase_uid == token['uid']).first()
+    result = await db.execute(select(models.User).filter(models.User.firebase_uid == token['uid']))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     if user.user_type != "PROJECT_LEADER":
         raise HTTPException(status_code=403, detail="Only project leaders can create projects")
 
+    # Store images before touching the database so an oversized upload
+    # fails the request without leaving a half-created project
+    image_urls = await store_images(images)
+
     # Create project
     new_project = models.Project(
         title=title,
         description=description,
         location=location,
+        **geo.location_columns(location),
+        timezone=geo.timezone_for(location),
         status=status,
         project_leader_id=user.id,
         created_by=user.id,
@@ -306,33 +380,30 @@ async def create_project(
     )
 
     db.add(new_project)
-    db.commit()
-    db.refresh(new_project)
-
-    # Handle image uploads
-    image_urls = []
-    for image in images:
-        # Generate a unique filename
-        filename = f"{new_project.id}_{uuid.uuid4()}{os.path.splitext(image.filename)[1]}"
-
-        # Save the file
-        file_path = os.path.join("uploads", filename)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-        with open(file_path, "wb") as buffer:
-            buffer.write(await image.read())
-
-        # Create image record
-        image_url = f"/uploads/{filename}"
-        db_image = models.ProjectImage(
-            project_id=new_project.id,
-            image_url=image_url
+    await db.flush()
+
+    # Skills the project needs, used for matching
+    if skill_ids:
+        await crud.sync_skills(db, models.project_skills, "project_id", new_project.id, skill_ids)
+
+    if image_urls:
+        await db.execute(
+            models.ProjectImage.__table__.insert(),
+            [{"project_id": new_project.id, "image_url": image_url} for image_url in image_urls],
         )
-        db.add(db_image)
-        image_urls.append(image_url)
 
+    await db.commit()
+
+    image_entries = []
     if image_urls:
-        db.commit()
+        # Thumbnails and web sizes are rendered after the response is sent
+        result = await db.execute(
+            select(models.ProjectImage.id, models.ProjectImage.image_url)
+            .filter(models.ProjectImage.project_id == new_project.id)
+            .order_by(models.ProjectImage.id)
+        )
+        background_tasks.add_task(image_variants.generate_variants, [tuple(row) for row in result.all()])
+        image_entries = [{"url": image_url} for image_url in image_urls]
 
     # Return project with images
     return {
@@ -344,7 +415,128 @@ async def create_project(
         "project_leader_id": new_project.project_leader_id,
         "created_at": new_project.created_at,
         "updated_at": new_project.updated_at,
-        "images": image_urls
+        "images": image_urls,
+        "image_variants": image_entries,
     }
 
+@app.get("/projects", response_model=schemas.ProjectPage)
+async def list_projects(
+    status: Optional[str] = None,
+    project_leader_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    try:
+        items, next_cursor = await crud.list_projects(
+            db, limit, cursor=cursor, status=status, project_leader_id=project_leader_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/search/subcontractors", response_model=schemas.SubcontractorSearchPage)
+async def search_subcontractors(
+    q: Optional[str] = None,
+    skill_id: List[int] = Query([]),
+    min_rate: Optional[int] = None,
+    max_rate: Optional[int] = None,
+    has_insurance: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    items, next_offset = await search.search_subcontractors(
+        db, q, skill_ids=skill_id, min_rate=min_rate, max_rate=max_rate,
+        has_insurance=has_insurance, limit=limit, offset=offset
+    )
+    return {"items": items, "next_offset": next_offset}
+
+@app.get("/search/projects", response_model=schemas.ProjectSearchPage)
+async def search_projects(
+    q: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    items, next_offset = await search.search_projects(db, q, status=status, limit=limit, offset=offset)
+    return {"items": items, "next_offset": next_offset}
+
+@app.put("/projects/{project_id}/assignments", response_model=schemas.ProjectAssignments)
+async def update_project_assignments(
+    project_id: int,
+    assignments: schemas.ProjectAssignmentsUpdate,
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    result = await db.execute(
+        select(models.Project.project_leader_id, models.User.firebase_uid)
+        .join(models.User, models.User.id == models.Project.project_leader_id)
+        .filter(models.Project.id == project_id)
+    )
+    project = result.first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if project.firebase_uid != token['uid']:
+        raise HTTPException(status_code=403, detail="Only the project leader can assign contractors")
+
+    contractor_ids = await crud.set_project_assignments(db, project_id, assignments.contractor_ids)
+    await db.commit()
+    return {"project_id": project_id, "contractor_ids": contractor_ids}
+
+@app.get("/projects/{project_id}/nearby-subcontractors", response_model=List[schemas.NearbySubcontractor])
+async def nearby_subcontractors(
+    project_id: int,
+    miles: float = Query(25, gt=0, le=500),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    result = await db.execute(
+        select(models.Project.latitude, models.Project.longitude).filter(models.Project.id == project_id)
+    )
+    project = result.first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if project.latitude is None:
+        raise HTTPException(status_code=422, detail="Project location could not be geocoded")
+
+    return await crud.nearby_subcontractors(db, project.latitude, project.longitude, miles, limit)
+
+@app.get("/projects/{project_id}/matches", response_model=List[schemas.SubcontractorMatch])
+async def match_subcontractors(
+    project_id: int,
+    k: int = Query(20, ge=1, le=200),
+    miles: float = Query(50, gt=0, le=500),
+    max_rate: Optional[float] = None,
+    db: AsyncSession = Depends(get_db),
+    token: dict = Depends(verify_token)
+):
+    matches = await matching_engine.match_project(db, project_id, k=k, radius_miles=miles, max_rate=max_rate)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # Display fields for the k results only
+    result = await db.execute(
+        select(models.Subcontractor.id, models.User.company_name, models.User.first_name, models.User.last_name)
+        .join(models.User, models.User.id == models.Subcontractor.user_id)
+        .filter(models.Subcontractor.id.in_([match["subcontractor_id"] for match in matches]))
+    )
+    names = {row.id: row for row in result.all()}
+    return [
+        {
+            **match,
+            "company_name": names[match["subcontractor_id"]].company_name,
+            "first_name": names[match["subcontractor_id"]].first_name,
+            "last_name": names[match["subcontractor_id"]].last_name,
+        }
+        for match in matches
+        if match["subcontractor_id"] in names
+    ]
+
 # Similar updates for other endpoints...
\ No newline at end of file
@@ -0,0 +1,280 @@
+import asyncio
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from . import models
+
+# Relative weight of each signal in a candidate's score
+SKILL_WEIGHT = 0.5
+DISTANCE_WEIGHT = 0.25
+RATE_WEIGHT = 0.15
+INSURANCE_WEIGHT = 0.1
+
+# Default search radius when the project has coordinates
+DEFAULT_RADIUS_MILES = 50.0
+
+EARTH_RADIUS_MILES = 3958.8
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Number of set bits per row of a 2-D uint64 array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1)
+    return np.unpackbits(words.view(np.uint8), axis=1).sum(axis=1)
+
+class MatchingSnapshot:
+    """
+    Array-backed copy of the subcontractor attributes used for ranking
+
+    Row i holds one subcontractor; skills are bitmasks over skill IDs,
+    stored as uint64 words. Rows are updated in place as subcontractors
+    change and deactivated when they are deleted.
+    """
+
+    def __init__(self, capacity: int = 1024, skill_words: int = 1):
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.skills = np.zeros((capacity, skill_words), dtype=np.uint64)
+        self.hourly_rate = np.full(capacity, np.nan, dtype=np.float64)
+        self.has_insurance = np.zeros(capacity, dtype=bool)
+        self.latitude = np.full(capacity, np.nan, dtype=np.float64)
+        self.longitude = np.full(capacity, np.nan, dtype=np.float64)
+        self.row_of: Dict[int, int] = {}
+
+    def _grow(self, capacity: int) -> None:
+        def grown(array, fill):
+            shape = (capacity,) + array.shape[1:]
+            new = np.full(shape, fill, dtype=array.dtype)
+            new[: len(array)] = array
+            return new
+
+        self.ids = grown(self.ids, 0)
+        self.active = grown(self.active, False)
+        self.skills = grown(self.skills, 0)
+        self.hourly_rate = grown(self.hourly_rate, np.nan)
+        self.has_insurance = grown(self.has_insurance, False)
+        self.latitude = grown(self.latitude, np.nan)
+        self.longitude = grown(self.longitude, np.nan)
+
+    def _ensure_skill_words(self, skill_id: int) -> None:
+        words = skill_id // 64 + 1
+        if words > self.skills.shape[1]:
+            wider = np.zeros((len(self.skills), words), dtype=np.uint64)
+            wider[:, : self.skills.shape[1]] = self.skills
+            self.skills = wider
+
+    def skill_mask(self, skill_ids: Iterable[int]) -> np.ndarray:
+        """Bitmask row for a set of skill IDs, sized like the snapshot's skill columns"""
+        skill_ids = list(skill_ids)
+        for skill_id in skill_ids:
+            self._ensure_skill_words(skill_id)
+        mask = np.zeros(self.skills.shape[1], dtype=np.uint64)
+        for skill_id in skill_ids:
+            mask[skill_id // 64] |= np.uint64(1) << np.uint64(skill_id % 64)
+        return mask
+
+    def upsert(self, row: Dict[str, Any], skill_ids: Iterable[int]) -> None:
+        """Insert or overwrite the row for one subcontractor"""
+        i = self.row_of.get(row["id"])
+        if i is None:
+            if self.size == len(self.ids):
+                self._grow(max(2 * len(self.ids), 1024))
+            i = self.size
+            self.size += 1
+            self.row_of[row["id"]] = i
+
+        self.ids[i] = row["id"]
+        self.active[i] = True
+        self.skills[i] = self.skill_mask(skill_ids)
+        self.hourly_rate[i] = np.nan if row["hourly_rate"] is None else row["hourly_rate"]
+        self.has_insurance[i] = bool(row["has_insurance"])
+        self.latitude[i] = np.nan if row["latitude"] is None else row["latitude"]
+        self.longitude[i] = np.nan if row["longitude"] is None else row["longitude"]
+
+    def deactivate(self, subcontractor_id: int) -> None:
+        i = self.row_of.get(subcontractor_id)
+        if i is not None:
+            self.active[i] = False
+
+    def rank(
+        self,
+        skill_ids: List[int],
+        latitude: Optional[float],
+        longitude: Optional[float],
+        radius_miles: float,
+        max_rate: Optional[float],
+        k: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Score every active subcontractor and return the top k
+
+        Args:
+            skill_ids: Skills the project needs; candidates must have at least one
+            latitude: Project latitude, or None to ignore distance
+            longitude: Project longitude
+            radius_miles: Candidates further away than this are excluded
+            max_rate: Candidates with a higher hourly rate are excluded
+            k: Number of results
+
+        Returns:
+            Candidates ordered by descending score, with score components
+        """
+        n = self.size
+        eligible = self.active[:n].copy()
+        score = np.zeros(n, dtype=np.float64)
+
+        coverage = np.ones(n, dtype=np.float64)
+        if skill_ids:
+            mask = self.skill_mask(skill_ids)
+            required = _popcount(mask[np.newaxis, :])[0]
+            coverage = _popcount(self.skills[:n] & mask) / required
+            eligible &= coverage > 0
+        score += SKILL_WEIGHT * coverage
+
+        distance = np.full(n, np.nan, dtype=np.float64)
+        if latitude is not None and longitude is not None:
+            phi1 = np.radians(latitude)
+            phi2 = np.radians(self.latitude[:n])
+            d_phi = phi2 - phi1
+            d_lambda = np.radians(self.longitude[:n] - longitude)
+            a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+            distance = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+            # NaN distances (no coordinates) fail the comparison and are excluded
+            with np.errstate(invalid="ignore"):
+                eligible &= distance <= radius_miles
+            score += DISTANCE_WEIGHT * np.nan_to_num(1 - distance / radius_miles)
+
+        rate = self.hourly_rate[:n]
+        if max_rate is not None:
+            with np.errstate(invalid="ignore"):
+                eligible &= ~(rate > max_rate)
+        known_rates = rate[eligible & ~np.isnan(rate)]
+        if len(known_rates):
+            # Cheaper is better; unknown rates score in the middle
+            ceiling = max_rate if max_rate is not None else known_rates.max()
+            rate_score = np.where(np.isnan(rate), 0.5, 1 - rate / max(ceiling, 1))
+            score += RATE_WEIGHT * np.clip(rate_score, 0, 1)
+
+        score += INSURANCE_WEIGHT * self.has_insurance[:n]
+
+        candidates = np.flatnonzero(eligible)
+        if len(candidates) > k:
+            top = np.argpartition(-score[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-score[candidates], kind="stable")]
+
+        return [
+            {
+                "subcontractor_id": int(self.ids[i]),
+                "score": round(float(score[i]), 4),
+                "skill_coverage": round(float(coverage[i]), 4),
+                "distance_miles": None if np.isnan(distance[i]) else round(float(distance[i]), 2),
+                "hourly_rate": None if np.isnan(rate[i]) else float(rate[i]),
+                "has_insurance": bool(self.has_insurance[i]),
+            }
+            for i in candidates
+        ]
+
+class MatchingEngine:
+    """Keeps a MatchingSnapshot in step with the database and ranks against it"""
+
+    def __init__(self):
+        self.snapshot = MatchingSnapshot()
+        self._loaded = False
+        self._max_id = 0
+        self._dirty: Set[int] = set()
+        self._lock = asyncio.Lock()
+
+    def mark_dirty(self, subcontractor_ids: Iterable[int]) -> None:
+        """Reload these subcontractors on the next ranking call"""
+        self._dirty.update(subcontractor_ids)
+
+    async def _load(self, db: AsyncSession, where) -> Set[int]:
+        subcontractors = models.Subcontractor.__table__
+        users = models.User.__table__
+        links = models.subcontractor_skills
+
+        result = await db.execute(
+            select(
+                subcontractors.c.id,
+                subcontractors.c.hourly_rate,
+                subcontractors.c.has_insurance,
+                users.c.latitude,
+                users.c.longitude,
+            )
+            .select_from(subcontractors.join(users, users.c.id == subcontractors.c.user_id))
+            .where(where)
+        )
+        rows = result.mappings().all()
+
+        skills_by_id: Dict[int, List[int]] = {row["id"]: [] for row in rows}
+        if rows:
+            result = await db.execute(
+                select(links.c.subcontractor_id, links.c.skill_id).where(
+                    links.c.subcontractor_id.in_(select(subcontractors.c.id).where(where))
+                )
+            )
+            for subcontractor_id, skill_id in result.all():
+                if subcontractor_id in skills_by_id:
+                    skills_by_id[subcontractor_id].append(skill_id)
+
+        for row in rows:
+            self.snapshot.upsert(row, skills_by_id[row["id"]])
+            self._max_id = max(self._max_id, row["id"])
+        return {row["id"] for row in rows}
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """Load new subcontractors and reload changed ones"""
+        subcontractors = models.Subcontractor.__table__
+        async with self._lock:
+            if not self._loaded:
+                await self._load(db, subcontractors.c.id > 0)
+                self._loaded = True
+                self._dirty.clear()
+                return
+
+            # Rows added since the last refresh (e.g. by a bulk import)
+            await self._load(db, subcontractors.c.id > self._max_id)
+
+            if self._dirty:
+                dirty, self._dirty = self._dirty, set()
+                found = await self._load(db, subcontractors.c.id.in_(dirty))
+                for subcontractor_id in dirty - found:
+                    self.snapshot.deactivate(subcontractor_id)
+
+    async def match_project(
+        self,
+        db: AsyncSession,
+        project_id: int,
+        k: int = 20,
+        radius_miles: float = DEFAULT_RADIUS_MILES,
+        max_rate: Optional[float] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Top-k subcontractors for a project
+
+        Returns:
+            Ranked candidates, or None if the project does not exist
+        """
+        projects = models.Project.__table__
+        result = await db.execute(
+            select(projects.c.latitude, projects.c.longitude).where(projects.c.id == project_id)
+        )
+        project = result.first()
+        if project is None:
+            return None
+
+        result = await db.execute(
+            select(models.project_skills.c.skill_id).where(models.project_skills.c.project_id == project_id)
+        )
+        skill_ids = list(result.scalars().all())
+
+        await self.refresh(db)
+        return self.snapshot.rank(
+            skill_ids, project.latitude, project.longitude, radius_miles, max_rate, k
+        )
+
+# Create a singleton instance
+matching_engine = MatchingEngine()
@@ -0,0 +1,329 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, delete, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+from typing import Callable, List, Tuple
+
+from . import geo, models
+from .phone import normalize_phone
+
+# Applied migrations; kept out of models.Base so create_all never touches it
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations',
+    migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+def _add_column(conn: Connection, table: Table, name: str) -> bool:
+    """
+    Add a column declared on the models unless it already exists
+
+    Columns are added as nullable, since SQLite cannot add a NOT NULL column
+    without a default to a table that has rows; backfill them in the migration.
+
+    Returns:
+        True if the column was added
+    """
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    if name in existing:
+        return False
+
+    column_type = table.c[name].type.compile(dialect=conn.dialect)
+    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {column_type}'))
+    return True
+
+def _create_index(conn: Connection, table: Table, name: str) -> None:
+    """Create an index declared on the models unless it already exists"""
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(conn, checkfirst=True)
+
+def _dedupe_association(conn: Connection, table: Table) -> None:
+    """Drop duplicate rows so a unique index can be built over the table"""
+    total = conn.execute(select(func.count()).select_from(table)).scalar_one()
+    rows = conn.execute(select(*table.c).distinct()).mappings().all()
+    if len(rows) < total:
+        conn.execute(delete(table))
+        conn.execute(insert(table), [dict(row) for row in rows])
+
+def _baseline(conn: Connection) -> None:
+    # Tables created by earlier create_all calls are left as they are
+    models.Base.metadata.create_all(conn)
+
+def _missing_columns(conn: Connection) -> None:
+    # Databases created before these columns were added to the models
+    _add_column(conn, models.User.__table__, 'location')
+
+    subcontractors = models.Subcontractor.__table__
+    if _add_column(conn, subcontractors, 'created_by'):
+        conn.execute(update(subcontractors).values(created_by=subcontractors.c.user_id))
+
+    projects = models.Project.__table__
+    if _add_column(conn, projects, 'created_by'):
+        conn.execute(update(projects).values(created_by=projects.c.project_leader_id))
+
+def _hot_path_indexes(conn: Connection) -> None:
+    projects = models.Project.__table__
+    for name in ['ix_projects_status_created_at', 'ix_projects_leader_created_at', 'ix_projects_created_at']:
+        _create_index(conn, projects, name)
+
+    _create_index(conn, models.Subcontractor.__table__, 'ix_subcontractors_created_by')
+    _create_index(conn, models.ProjectImage.__table__, 'ix_project_images_project_id')
+
+    for table in [models.subcontractor_skills, models.project_leader_skills]:
+        _dedupe_association(conn, table)
+        _create_index(conn, table, f'uq_{table.name}_pair')
+        _create_index(conn, table, f'ix_{table.name}_skill')
+
+# Search rows for subcontractors, denormalized from users, skills and skill links
+_SUBCONTRACTOR_SEARCH_ROWS = """
+    INSERT INTO subcontractor_search (rowid, company_name, contact_name, location, skills)
+    SELECT s.id, u.company_name, u.first_name || ' ' || u.last_name, u.location,
+           (SELECT group_concat(k.name, ' ')
+              FROM subcontractor_skills ss JOIN skills k ON k.id = ss.skill_id
+             WHERE ss.subcontractor_id = s.id)
+      FROM subcontractors s JOIN users u ON u.id = s.user_id
+"""
+
+# Recomputes one subcontractor's search row inside a trigger body
+_SUBCONTRACTOR_SEARCH_REFRESH = (
+    "DELETE FROM subcontractor_search WHERE rowid = {id};"
+    + _SUBCONTRACTOR_SEARCH_ROWS
+    + " WHERE s.id = {id};"
+)
+
+_SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS subcontractor_search USING fts5(
+        company_name, contact_name, location, skills, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS subcontractor_search_ai AFTER INSERT ON subcontractors BEGIN
+        {_SUBCONTRACTOR_SEARCH_REFRESH.format(id='new.id')}
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS subcontractor_search_ad AFTER DELETE ON subcontractors BEGIN
+        DELETE FROM subcontractor_search WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS subcontractor_search_au AFTER UPDATE OF user_id ON subcontractors BEGIN
+        {_SUBCONTRACTOR_SEARCH_REFRESH.format(id='new.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS subcontractor_search_user_au
+        AFTER UPDATE OF first_name, last_name, company_name, location ON users BEGIN
+        {_SUBCONTRACTOR_SEARCH_REFRESH.format(id='(SELECT id FROM subcontractors WHERE user_id = new.id)')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS subcontractor_search_skill_ai AFTER INSERT ON subcontractor_skills BEGIN
+        {_SUBCONTRACTOR_SEARCH_REFRESH.format(id='new.subcontractor_id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS subcontractor_search_skill_ad AFTER DELETE ON subcontractor_skills BEGIN
+        {_SUBCONTRACTOR_SEARCH_REFRESH.format(id='old.subcontractor_id')}
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS project_search USING fts5(
+        title, description, location, content = 'projects', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS project_search_ai AFTER INSERT ON projects BEGIN
+        INSERT INTO project_search (rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS project_search_ad AFTER DELETE ON projects BEGIN
+        INSERT INTO project_search (project_search, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS project_search_au AFTER UPDATE OF title, description, location ON projects BEGIN
+        INSERT INTO project_search (project_search, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO project_search (rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+]
+
+def _search_index(conn: Connection) -> None:
+    # Full-text search uses SQLite FTS5; other databases fall back to LIKE scans
+    if conn.dialect.name != 'sqlite':
+        return
+
+    for statement in _SEARCH_INDEX_DDL:
+        conn.exec_driver_sql(statement)
+
+    # Index rows that existed before the triggers
+    conn.exec_driver_sql("DELETE FROM subcontractor_search")
+    conn.exec_driver_sql(_SUBCONTRACTOR_SEARCH_ROWS)
+    conn.exec_driver_sql("INSERT INTO project_search (project_search) VALUES ('rebuild')")
+
+def _geocoded_locations(conn: Connection) -> None:
+    for table in [models.User.__table__, models.Project.__table__]:
+        for name in ['latitude', 'longitude', 'geohash']:
+            _add_column(conn, table, name)
+        _create_index(conn, table, f'ix_{table.name}_geohash')
+
+        rows = conn.execute(
+            select(table.c.id, table.c.location).where(
+                table.c.location.isnot(None), table.c.geohash.is_(None)
+            )
+        ).all()
+        updates = []
+        for id, location in rows:
+            columns = geo.location_columns(location)
+            if columns['geohash']:
+                updates.append({'row_id': id, **columns})
+        if updates:
+            conn.execute(
+                update(table).where(table.c.id == bindparam('row_id')).values(
+                    latitude=bindparam('latitude'),
+                    longitude=bindparam('longitude'),
+                    geohash=bindparam('geohash'),
+                ),
+                updates,
+            )
+
+def _project_skills(conn: Connection) -> None:
+    models.project_skills.create(conn, checkfirst=True)
+
+def _image_variants(conn: Connection) -> None:
+    # Existing images get variants the next time the backfill runs
+    models.ProjectImageVariant.__table__.create(conn, checkfirst=True)
+
+def _project_assignments(conn: Connection) -> None:
+    models.project_assignments.create(conn, checkfirst=True)
+
+def _notification_outbox(conn: Connection) -> None:
+    models.NotificationOutbox.__table__.create(conn, checkfirst=True)
+
+def _reminder_scheduling(conn: Connection) -> None:
+    models.ReminderLease.__table__.create(conn, checkfirst=True)
+
+    projects = models.Project.__table__
+    if _add_column(conn, projects, 'timezone'):
+        rows = conn.execute(
+            select(projects.c.id, projects.c.location).where(projects.c.location.isnot(None))
+        ).all()
+        updates = [
+            {'row_id': id, 'timezone': timezone}
+            for id, timezone in ((id, geo.timezone_for(location)) for id, location in rows)
+            if timezone
+        ]
+        if updates:
+            conn.execute(
+                update(projects).where(projects.c.id == bindparam('row_id')).values(timezone=bindparam('timezone')),
+                updates,
+            )
+
+def _delivery_status(conn: Connection) -> None:
+    outbox = models.NotificationOutbox.__table__
+    for name in ['delivery_status', 'delivery_error_code', 'delivery_updated_at']:
+        _add_column(conn, outbox, name)
+    _create_index(conn, outbox, 'ix_notification_outbox_message_sid')
+
+def _phone_numbers(conn: Connection) -> None:
+    users = models.User.__table__
+    if _add_column(conn, users, 'phone_e164'):
+        rows = conn.execute(
+            select(users.c.id, users.c.phone).where(users.c.phone.isnot(None)).order_by(users.c.id)
+        ).all()
+        owners = {}
+        for id, phone in rows:
+            normalized = normalize_phone(phone)
+            if normalized is None:
+                continue
+            if normalized in owners:
+                # The earliest account keeps a shared number
+                print(f"User {id} shares phone {normalized} with user {owners[normalized]}; left unset")
+                continue
+            owners[normalized] = id
+        if owners:
+            conn.execute(
+                update(users).where(users.c.id == bindparam('row_id')).values(phone_e164=bindparam('phone_e164')),
+                [{'row_id': id, 'phone_e164': normalized} for normalized, id in owners.items()],
+            )
+    _create_index(conn, users, 'uq_users_phone_e164')
+
+    outbox = models.NotificationOutbox.__table__
+    for name in ['response', 'responded_at']:
+        _add_column(conn, outbox, name)
+    _create_index(conn, outbox, 'ix_notification_outbox_contractor')
+
+def _nullable_firebase_uid(conn: Connection) -> None:
+    # Databases created by the first models required firebase_uid, but
+    # imported contractors have no Firebase account until they sign up
+    users = models.User.__table__
+    columns = inspect(conn).get_columns(users.name)
+    if next(column for column in columns if column['name'] == 'firebase_uid')['nullable']:
+        return
+
+    if conn.dialect.name != 'sqlite':
+        conn.execute(text(f'ALTER TABLE {users.name} ALTER COLUMN firebase_uid DROP NOT NULL'))
+        return
+
+    # SQLite cannot change a column's constraints, so rebuild the table from
+    # the models. Index names are global, so indexes are built after the swap;
+    # dropping users drops its search trigger, which is recreated. Legacy
+    # renaming leaves the search triggers on other tables alone, which would
+    # otherwise fail the rename while users is missing.
+    rebuilt = users.to_metadata(MetaData(), name=f'{users.name}_rebuilt')
+    conn.execute(CreateTable(rebuilt, include_foreign_key_constraints=[]))
+    names = ', '.join(column['name'] for column in columns)
+    conn.exec_driver_sql(f'INSERT INTO {rebuilt.name} ({names}) SELECT {names} FROM {users.name}')
+    conn.exec_driver_sql(f'DROP TABLE {users.name}')
+    conn.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+    conn.exec_driver_sql(f'ALTER TABLE {rebuilt.name} RENAME TO {users.name}')
+    conn.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+    for index in users.indexes:
+        index.create(conn, checkfirst=True)
+    for statement in _SEARCH_INDEX_DDL:
+        conn.exec_driver_sql(statement)
+
+# (version, description, upgrade) in the order they must be applied.
+# Upgrades must be safe to run against a database created by create_all
+# from the current models, since the baseline builds fresh databases that way.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Baseline schema", _baseline),
+    (2, "Add columns missing from databases created by older models", _missing_columns),
+    (3, "Hot-path indexes on projects, subcontractors and skill links", _hot_path_indexes),
+    (4, "Full-text search indexes for subcontractors and projects", _search_index),
+    (5, "Geocoded coordinates and geohash indexes for users and projects", _geocoded_locations),
+    (6, "Required skills for projects", _project_skills),
+    (7, "Thumbnail and web variants of project images", _image_variants),
+    (8, "Contractors assigned to projects", _project_assignments),
+    (9, "Outbox for project reminder notifications", _notification_outbox),
+    (10, "Project timezones and reminder shard leases", _reminder_scheduling),
+    (11, "Delivery status of reminder notifications", _delivery_status),
+    (12, "Normalized phone numbers and reminder replies", _phone_numbers),
+    (13, "Allow users without a Firebase account", _nullable_firebase_uid),
+]
+
+def run_migrations(conn: Connection) -> List[int]:
+    """
+    Apply pending migrations on a connection
+
+    Args:
+        conn: A connection inside the transaction the migrations run in
+
+    Returns:
+        The versions that were applied
+    """
+    migration_metadata.create_all(conn)
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars().all())
+
+    newly_applied = []
+    for version, description, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+
+        upgrade(conn)
+        conn.execute(insert(schema_migrations).values(
+            version=version, description=description, applied_at=datetime.now()
+        ))
+        print(f"Applied migration {version}: {description}")
+        newly_applied.append(version)
+
+    return newly_applied
+
+def migrate(engine) -> List[int]:
+    """Bring a sync engine's database up to the latest schema version"""
+    with engine.begin() as conn:
+        return run_migrations(conn)
+
+async def migrate_async(async_engine) -> List[int]:
+    """Bring an async engine's database up to the latest schema version"""
+    async with async_engine.begin() as conn:
+        return await conn.run_sync(run_migrations)
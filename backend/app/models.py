@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table, Enum, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table, Enum, Date, DateTime, Index, Float
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from .schemas import UserType  # Import UserType from schemas instead of defining a new one
@@ -10,14 +10,35 @@ subcontractor_skills = Table(
     'subcontractor_skills',
     Base.metadata,
     Column('subcontractor_id', Integer, ForeignKey('subcontractors.id')),
-    Column('skill_id', Integer, ForeignKey('skills.id'))
+    Column('skill_id', Integer, ForeignKey('skills.id')),
+    Index('uq_subcontractor_skills_pair', 'subcontractor_id', 'skill_id', unique=True),
+    Index('ix_subcontractor_skills_skill', 'skill_id', 'subcontractor_id'),
 )
 
 project_leader_skills = Table(
     'project_leader_skills',
     Base.metadata,
     Column('project_leader_id', Integer, ForeignKey('project_leaders.id')),
-    Column('skill_id', Integer, ForeignKey('skills.id'))
+    Column('skill_id', Integer, ForeignKey('skills.id')),
+    Index('uq_project_leader_skills_pair', 'project_leader_id', 'skill_id', unique=True),
+    Index('ix_project_leader_skills_skill', 'skill_id', 'project_leader_id'),
+)
+
+# Skills a project needs, used to match subcontractors
+project_skills = Table(
+    'project_skills',
+    Base.metadata,
+    Column('project_id', Integer, ForeignKey('projects.id'), primary_key=True),
+    Column('skill_id', Integer, ForeignKey('skills.id'), primary_key=True),
+)
+
+# Contractors (SUBCONTRACTOR users) assigned to work on a project
+project_assignments = Table(
+    'project_assignments',
+    Base.metadata,
+    Column('project_id', Integer, ForeignKey('projects.id'), primary_key=True),
+    Column('contractor_id', Integer, ForeignKey('users.id'), primary_key=True),
+    Index('ix_project_assignments_contractor', 'contractor_id', 'project_id'),
 )
 
 class User(Base):
@@ -29,14 +50,26 @@ class User(Base):
     first_name = Column(String)
     last_name = Column(String)
     phone = Column(String, nullable=True)
+    phone_e164 = Column(String, nullable=True)  # Normalized from phone at write time
     company_name = Column(String, nullable=True)
     user_type = Column(Enum(UserType))
     location = Column(String, nullable=True)
+    # Geocoded from location at write time
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String, nullable=True, index=True)
 
     # One-to-one relationship with either Subcontractor or ProjectLeader
-    subcontractor = relationship("Subcontractor", back_populates="user", uselist=False)
+    subcontractor = relationship(
+        "Subcontractor", back_populates="user", uselist=False, foreign_keys="Subcontractor.user_id"
+    )
     project_leader = relationship("ProjectLeader", back_populates="user", uselist=False)
 
+    __table_args__ = (
+        # Inbound SMS are routed to their sender by number
+        Index('uq_users_phone_e164', 'phone_e164', unique=True),
+    )
+
 class Skill(Base):
     __tablename__ = 'skills'
 
@@ -49,12 +82,12 @@ class Subcontractor(Base):
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), unique=True)
-    created_by = Column(Integer, ForeignKey('users.id'), nullable=False)
+    created_by = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     hourly_rate = Column(Integer)
     has_insurance = Column(Boolean, default=False)
 
     # Relationships
-    user = relationship("User", back_populates="subcontractor")
+    user = relationship("User", back_populates="subcontractor", foreign_keys=[user_id])
     skills = relationship("Skill", secondary=subcontractor_skills)
 
 class ProjectLeader(Base):
@@ -74,6 +107,11 @@ class Project(Base):
     title = Column(String, nullable=False)
     description = Column(String)
     location = Column(String)
+    # Geocoded from location at write time
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String, nullable=True, index=True)
+    timezone = Column(String, nullable=True)  # IANA name, used to time reminders
     status = Column(String, nullable=False)  # draft, published, in_progress, completed, cancelled
     project_leader_id = Column(Integer, ForeignKey('users.id'))
     created_by = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -83,13 +121,85 @@ class Project(Base):
     # Relationships
     project_leader = relationship("User", foreign_keys=[project_leader_id])
     images = relationship("ProjectImage", back_populates="project")
+    skills = relationship("Skill", secondary=project_skills)
+    contractors = relationship("User", secondary=project_assignments)
+
+    __table_args__ = (
+        # Scheduler (status + date range) and status-filtered listings
+        Index('ix_projects_status_created_at', 'status', 'created_at', 'id'),
+        # A leader's projects, newest first
+        Index('ix_projects_leader_created_at', 'project_leader_id', 'created_at', 'id'),
+        Index('ix_projects_created_at', 'created_at', 'id'),
+    )
 
 class ProjectImage(Base):
     __tablename__ = 'project_images'
 
     id = Column(Integer, primary_key=True)
-    project_id = Column(Integer, ForeignKey('projects.id'))
+    project_id = Column(Integer, ForeignKey('projects.id'), index=True)
+    image_url = Column(String, nullable=False)
+
+    # Relationships
+    project = relationship("Project", back_populates="images")
+    variants = relationship("ProjectImageVariant", back_populates="image")
+
+class ProjectImageVariant(Base):
+    __tablename__ = 'project_image_variants'
+
+    id = Column(Integer, primary_key=True)
+    image_id = Column(Integer, ForeignKey('project_images.id'), nullable=False)
+    variant = Column(String, nullable=False)  # "thumbnail" or "web"
     image_url = Column(String, nullable=False)
+    width = Column(Integer)
+    height = Column(Integer)
+    size_bytes = Column(Integer)
 
     # Relationships
-    project = relationship("Project", back_populates="images")
\ No newline at end of file
+    image = relationship("ProjectImage", back_populates="variants")
+
+    __table_args__ = (
+        Index('uq_project_image_variants_image_variant', 'image_id', 'variant', unique=True),
+    )
+
+class NotificationOutbox(Base):
+    __tablename__ = 'notification_outbox'
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
+    contractor_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    reminder_date = Column(Date, nullable=False)  # The project date the reminder is for
+    status = Column(String, nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    claim_id = Column(String, nullable=True)  # Set by the worker that is sending the row
+    claimed_at = Column(DateTime, nullable=True)
+    message_sid = Column(String, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    delivery_status = Column(String, nullable=True)  # Latest Twilio status, e.g. delivered or undelivered
+    delivery_error_code = Column(String, nullable=True)
+    delivery_updated_at = Column(DateTime, nullable=True)
+    response = Column(String, nullable=True)  # confirmed or declined, from the contractor's SMS reply
+    responded_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # One reminder per contractor, project and date, however often the scheduler runs
+        Index('uq_notification_outbox_key', 'project_id', 'contractor_id', 'reminder_date', unique=True),
+        # Workers claim pending rows in id order and look up their own claims
+        Index('ix_notification_outbox_status', 'status', 'id'),
+        Index('ix_notification_outbox_claim', 'claim_id'),
+        # Delivery status callbacks are matched by message SID
+        Index('ix_notification_outbox_message_sid', 'message_sid'),
+        # Replies apply to the contractor's next upcoming reminders
+        Index('ix_notification_outbox_contractor', 'contractor_id', 'reminder_date'),
+    )
+
+class ReminderLease(Base):
+    __tablename__ = 'reminder_leases'
+
+    # One row per shard of a reminder run, e.g. ("America/Chicago:2024-06-01", 3)
+    run_key = Column(String, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    owner = Column(String, nullable=True)
+    leased_until = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,288 @@
+import os
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, exists, func, literal, or_, select, true, update
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+from .twilio_service import twilio_service
+
+# Contractors whose reminders are claimed and sent per round
+OUTBOX_BATCH_SIZE = 200
+
+# Rows left in "sending" this long belong to a worker that died mid-batch;
+# must be well above the time one batch takes to send
+OUTBOX_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Timezone assumed for projects whose location could not be resolved
+DEFAULT_PROJECT_TIMEZONE = os.environ.get('DEFAULT_PROJECT_TIMEZONE', 'America/Chicago')
+
+def _in_shard(contractor_id, shard: Optional[Tuple[int, int]]):
+    """Condition selecting one shard's contractors, or everyone if `shard` is None"""
+    if shard is None:
+        return true()
+    index, count = shard
+    return contractor_id % count == index
+
+def enqueue_statement(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    reminder_date: date,
+    timezone: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None,
+):
+    """
+    The INSERT ... SELECT that `enqueue_project_reminders` runs
+
+    Built separately so check_query_plans.py checks the plan of the
+    statement the scheduler actually executes. Arguments are as for
+    `enqueue_project_reminders`.
+    """
+    projects = models.Project.__table__
+    assignments = models.project_assignments
+    outbox = models.NotificationOutbox.__table__
+
+    already_queued = exists().where(
+        outbox.c.project_id == assignments.c.project_id,
+        outbox.c.contractor_id == assignments.c.contractor_id,
+        outbox.c.reminder_date == reminder_date,
+    )
+    due = (
+        select(
+            assignments.c.project_id,
+            assignments.c.contractor_id,
+            literal(reminder_date, outbox.c.reminder_date.type),
+            literal("pending"),
+            literal(0),
+            literal(datetime.now(), outbox.c.created_at.type),
+        )
+        .select_from(assignments.join(projects, projects.c.id == assignments.c.project_id))
+        .where(
+            projects.c.status == "in_progress",
+            projects.c.created_at >= start,
+            projects.c.created_at <= end,
+            _in_shard(assignments.c.contractor_id, shard),
+            ~already_queued,
+        )
+    )
+    if timezone is not None:
+        due = due.where(func.coalesce(projects.c.timezone, DEFAULT_PROJECT_TIMEZONE) == timezone)
+    return crud.insert_ignoring_conflicts(db, outbox).from_select(
+        ["project_id", "contractor_id", "reminder_date", "status", "attempts", "created_at"], due
+    )
+
+def enqueue_project_reminders(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    reminder_date: date,
+    timezone: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None,
+) -> int:
+    """
+    Queue a reminder for every contractor assigned to a project in the window
+
+    One INSERT ... SELECT; rows already queued for the same project,
+    contractor and date are skipped, so running this again is harmless.
+    The caller commits.
+
+    Args:
+        db: Database session
+        start: Start of the window projects must fall in
+        end: End of the window
+        reminder_date: The date the reminders are for
+        timezone: Only projects in this timezone; projects without one
+            count as DEFAULT_PROJECT_TIMEZONE
+        shard: (index, count) to only queue contractors whose id % count == index
+
+    Returns:
+        Number of reminders queued
+    """
+    result = db.execute(enqueue_statement(db, start, end, reminder_date, timezone, shard))
+    return max(result.rowcount, 0)
+
+def _for_run(timezone: Optional[str], reminder_date: Optional[date]):
+    """Condition selecting one reminder run's rows, or every row if neither is given"""
+    outbox = models.NotificationOutbox.__table__
+    projects = models.Project.__table__
+    conditions = []
+    if reminder_date is not None:
+        conditions.append(outbox.c.reminder_date == reminder_date)
+    if timezone is not None:
+        conditions.append(outbox.c.project_id.in_(
+            select(projects.c.id).where(func.coalesce(projects.c.timezone, DEFAULT_PROJECT_TIMEZONE) == timezone)
+        ))
+    return and_(true(), *conditions)
+
+def _claim_batch(
+    db: Session,
+    batch_size: int,
+    shard: Optional[Tuple[int, int]] = None,
+    timezone: Optional[str] = None,
+    reminder_date: Optional[date] = None,
+) -> Optional[str]:
+    """
+    Mark the claimable rows of up to `batch_size` contractors as sending
+
+    All of a contractor's rows are claimed together so they can be sent
+    as one digest. Rows stuck in "sending" past OUTBOX_CLAIM_TIMEOUT are
+    claimed again. The UPDATE only matches rows that are still claimable,
+    so two workers never claim the same row.
+
+    Returns:
+        The claim id, or None if there was nothing to claim
+    """
+    outbox = models.NotificationOutbox.__table__
+    now = datetime.now()
+    claimable = and_(
+        or_(
+            outbox.c.status == "pending",
+            and_(outbox.c.status == "sending", outbox.c.claimed_at < now - OUTBOX_CLAIM_TIMEOUT),
+        ),
+        _in_shard(outbox.c.contractor_id, shard),
+        _for_run(timezone, reminder_date),
+    )
+    contractors = db.execute(
+        select(outbox.c.contractor_id)
+        .where(claimable)
+        .group_by(outbox.c.contractor_id)
+        .order_by(func.min(outbox.c.id))
+        .limit(batch_size)
+    ).scalars().all()
+    if not contractors:
+        return None
+
+    claim_id = uuid.uuid4().hex
+    db.execute(
+        update(outbox)
+        .where(outbox.c.contractor_id.in_(contractors), claimable)
+        .values(status="sending", claim_id=claim_id, claimed_at=now, attempts=outbox.c.attempts + 1)
+    )
+    db.commit()
+    return claim_id
+
+def _send_claimed(db: Session, claim_id: str) -> Dict[str, int]:
+    """
+    Send the rows of one claim as one digest per contractor and date, and record the outcomes
+
+    The claim is renewed just before sending, and only rows it still holds
+    are sent: rows another worker reclaimed while this one stalled after
+    claiming are left to that worker, and the renewed claim can't be taken
+    over while the batch is being sent.
+    """
+    outbox = models.NotificationOutbox.__table__
+    projects = models.Project.__table__
+    users = models.User.__table__
+
+    db.execute(
+        update(outbox)
+        .where(outbox.c.claim_id == claim_id, outbox.c.status == "sending")
+        .values(claimed_at=datetime.now())
+    )
+    db.commit()
+
+    rows = db.execute(
+        select(
+            outbox.c.id,
+            outbox.c.contractor_id,
+            outbox.c.reminder_date,
+            projects.c.title,
+            projects.c.location,
+            projects.c.description,
+            users.c.first_name,
+            users.c.last_name,
+            # Numbers shared with another account have no E.164 form stored
+            func.coalesce(users.c.phone_e164, users.c.phone).label("phone"),
+        )
+        .select_from(
+            outbox
+            .join(projects, projects.c.id == outbox.c.project_id)
+            .join(users, users.c.id == outbox.c.contractor_id)
+        )
+        .where(outbox.c.claim_id == claim_id, outbox.c.status == "sending")
+        .order_by(outbox.c.id)
+    ).all()
+
+    # Coalesce each contractor's reminders for a date into one message
+    digests: Dict[Tuple[int, date], List] = {}
+    for row in rows:
+        digests.setdefault((row.contractor_id, row.reminder_date), []).append(row)
+    groups = list(digests.values())
+
+    results = twilio_service.send_project_digests(
+        [(group, f"{group[0].first_name} {group[0].last_name}", group[0].phone) for group in groups]
+    )
+
+    now = datetime.now()
+    outcomes = []
+    for group, result in zip(groups, results):
+        for row in group:
+            if result is None:
+                outcomes.append({"row_id": row.id, "new_status": "failed", "sid": None, "error": "No phone number", "sent": None})
+            elif result.error:
+                outcomes.append({"row_id": row.id, "new_status": "failed", "sid": None, "error": result.error, "sent": None})
+            else:
+                outcomes.append({"row_id": row.id, "new_status": "sent", "sid": result.sid, "error": None, "sent": now})
+
+    if outcomes:
+        # A row reclaimed by another worker in the meantime keeps that worker's outcome
+        db.execute(
+            update(outbox)
+            .where(outbox.c.id == bindparam("row_id"), outbox.c.claim_id == claim_id)
+            .values(
+                status=bindparam("new_status"),
+                message_sid=bindparam("sid"),
+                last_error=bindparam("error"),
+                sent_at=bindparam("sent"),
+            )
+            .execution_options(synchronize_session=False),
+            outcomes,
+        )
+        db.commit()
+
+    sent = sum(1 for outcome in outcomes if outcome["new_status"] == "sent")
+    messages = sum(1 for result in results if result is not None and result.error is None)
+    return {"messages": messages, "sent": sent, "failed": len(outcomes) - sent}
+
+def drain_outbox(
+    batch_size: int = OUTBOX_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    timezone: Optional[str] = None,
+    reminder_date: Optional[date] = None,
+) -> Dict[str, int]:
+    """
+    Send pending reminders in batches until the outbox is empty
+
+    Each batch is claimed, sent and marked in its own transactions, and
+    several workers can drain at once without sending a row twice.
+    Delivery is at least once: if a worker dies after sending a batch but
+    before recording it, the batch's rows are picked up again once their
+    claim times out and are sent a second time.
+
+    Args:
+        batch_size: Contractors claimed per batch
+        max_batches: Stop after this many batches, e.g. to fit a function's time limit
+        shard: (index, count) to only send to contractors whose id % count == index
+        timezone: Only reminders for projects in this timezone, as in
+            `enqueue_project_reminders`
+        reminder_date: Only reminders for this date
+
+    Returns:
+        Counts of messages sent and of reminders sent and failed
+    """
+    totals = {"messages": 0, "sent": 0, "failed": 0}
+    batches = 0
+    with SessionLocal() as db:
+        while max_batches is None or batches < max_batches:
+            claim_id = _claim_batch(db, batch_size, shard, timezone, reminder_date)
+            if claim_id is None:
+                break
+            for key, count in _send_claimed(db, claim_id).items():
+                totals[key] += count
+            batches += 1
+    return totals
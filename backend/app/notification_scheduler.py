@@ -1,93 +1,40 @@
 import time
-import schedule
 import threading
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from datetime import datetime
 from firebase_functions import https_fn, scheduler_fn
-from firebase_admin import initialize_app, firestore
 
-from .database import SessionLocal
-from .twilio_service import twilio_service
-from . import models
-
-# Initialize Firebase app if not already initialized
-try:
-    app = initialize_app()
-except ValueError:
-    # App already initialized
-    pass
-
-def get_db():
-    """Get a database session"""
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        db.close()
+# The reminder pipeline (SQLAlchemy, models, SMS dispatch) is imported inside
+# each function, so function instances that never send reminders don't load it
 
 def check_upcoming_projects():
     """
-    Check for projects starting within the next 24 hours and send notifications
-    """
-    print(f"Running upcoming projects check at {datetime.now()}")
-    db = get_db()
-
-    # Calculate the date range for projects starting in 24 hours
-    tomorrow = datetime.now() + timedelta(days=1)
-    start_of_tomorrow = datetime(tomorrow.year, tomorrow.month, tomorrow.day, 0, 0, 0)
-    end_of_tomorrow = datetime(tomorrow.year, tomorrow.month, tomorrow.day, 23, 59, 59)
-
-    # Query for projects starting tomorrow
-    upcoming_projects = db.query(models.Project).filter(
-        models.Project.status == "in_progress",
-        models.Project.created_at >= start_of_tomorrow,
-        models.Project.created_at <= end_of_tomorrow
-    ).all()
-
-    print(f"Found {len(upcoming_projects)} projects starting tomorrow")
+    Send reminders for projects starting tomorrow in every project timezone, now
 
-    for project in upcoming_projects:
-        # For each project, get assigned contractors
-        # This will need to be adjusted based on your actual data model
-        # Assuming there's a many-to-many relationship between projects and contractors
-        # You'll need to modify this based on your actual database schema
-        assigned_contractors = []
-
-        # Example of a relationship that might exist
-        # assigned_contractors = db.query(models.User).join(
-        #     models.project_contractors,
-        #     models.User.id == models.project_contractors.c.contractor_id
-        # ).filter(
-        #     models.project_contractors.c.project_id == project.id
-        # ).all()
-
-        # If no relationship is defined yet, this is a placeholder to retrieve all contractors
-        # Modify this based on your actual data model
-        assigned_contractors = db.query(models.User).filter(
-            models.User.user_type == "SUBCONTRACTOR"
-        ).all()
-
-        print(f"Project '{project.title}' has {len(assigned_contractors)} assigned contractors")
+    Used by the manual trigger. Safe to run more than once and from several
+    places at once: runs already finished are skipped through the lease
+    table, and each queued reminder is claimed by one worker at a time.
+    """
+    from .reminder_scheduler import run_tomorrows_reminders
 
-        # Send notifications to each contractor
-        for contractor in assigned_contractors:
-            twilio_service.notify_contractor_for_project(db, contractor.id, project)
+    print(f"Running upcoming projects check at {datetime.now()}")
+    totals = run_tomorrows_reminders(only_due=False)
+    print(f"Sent {totals['sent']} reminders in {totals['messages']} messages ({totals['failed']} failed)")
 
 # Function to run the scheduler in the background
 def run_scheduler():
-    """Run the scheduler in a background thread"""
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+    """Fire each timezone's reminders at REMINDER_LOCAL_TIME until stopped"""
+    from .reminder_scheduler import ReminderScheduler
 
-# Schedule the job to run daily
-schedule.every().day.at("00:00").do(check_upcoming_projects)
+    ReminderScheduler().run_forever()
 
 # For Firebase Functions scheduled jobs (Cloud Functions)
-@scheduler_fn.on_schedule(schedule="every 24 hours")
+# Runs hourly so each timezone is picked up soon after its local reminder time
+@scheduler_fn.on_schedule(schedule="every 1 hours")
 def scheduled_project_notifications(event: scheduler_fn.ScheduledEvent) -> None:
     """Firebase scheduled function to send notifications for upcoming projects"""
-    check_upcoming_projects()
+    from .reminder_scheduler import run_tomorrows_reminders
+
+    run_tomorrows_reminders()
     return None
 
 # For HTTP triggered notification check (manual trigger or testing)
@@ -0,0 +1,37 @@
+import re
+from typing import Optional
+
+# Country code assumed for numbers entered without one
+DEFAULT_COUNTRY_CODE = "1"
+
+_NON_DIGITS = re.compile(r"\D")
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Normalize a phone number to E.164, e.g. "(512) 555-0100" -> "+15125550100"
+
+    Numbers without a leading + are taken as North American: ten digits,
+    or eleven starting with the country code. Punctuation and spaces are
+    ignored.
+
+    Args:
+        phone: The phone number as entered
+
+    Returns:
+        The E.164 number, or None if the input can't be one
+    """
+    if not phone:
+        return None
+
+    phone = phone.strip()
+    digits = _NON_DIGITS.sub("", phone)
+    if phone.startswith("+") or phone.startswith("00"):
+        digits = digits[2:] if phone.startswith("00") else digits
+        # E.164 allows at most 15 digits; the shortest real numbers have 8
+        return f"+{digits}" if 8 <= len(digits) <= 15 and digits[0] != "0" else None
+
+    if len(digits) == 11 and digits.startswith(DEFAULT_COUNTRY_CODE):
+        digits = digits[1:]
+    if len(digits) != 10:
+        return None
+    return f"+{DEFAULT_COUNTRY_CODE}{digits}"
@@ -0,0 +1,221 @@
+import heapq
+import os
+import random
+import socket
+import threading
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+from .notification_outbox import DEFAULT_PROJECT_TIMEZONE, drain_outbox, enqueue_project_reminders
+
+# Local time, in each project's timezone, at which reminders for the next day go out
+REMINDER_LOCAL_TIME = time.fromisoformat(os.environ.get('REMINDER_LOCAL_TIME', '18:00'))
+
+# Shards each run is split into; a contractor always falls in the same shard
+REMINDER_SHARDS = int(os.environ.get('REMINDER_SHARDS', '8'))
+
+# A shard whose owner stops renewing for this long can be taken over
+LEASE_DURATION = timedelta(minutes=5)
+
+# Longest the scheduler sleeps before looking for new project timezones
+REFRESH_INTERVAL = timedelta(minutes=15)
+
+# Identifies this process in the lease table
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def project_timezones() -> List[str]:
+    """Timezones of in-progress projects, with unknown ones as DEFAULT_PROJECT_TIMEZONE"""
+    projects = models.Project.__table__
+    with SessionLocal() as db:
+        names = db.execute(
+            select(func.coalesce(projects.c.timezone, DEFAULT_PROJECT_TIMEZONE))
+            .where(projects.c.status == "in_progress")
+            .distinct()
+        ).scalars().all()
+
+    timezones = []
+    for name in names:
+        try:
+            ZoneInfo(name)
+            timezones.append(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"Skipping reminders for unknown timezone: {name}")
+    return sorted(timezones)
+
+def _server_local(moment: datetime) -> datetime:
+    # Project timestamps are stored as naive server-local times
+    return moment.astimezone().replace(tzinfo=None)
+
+def _acquire_lease(db: Session, run_key: str, shard: int) -> bool:
+    """Take or renew the lease on one shard of a run; False if it is done or held by another worker"""
+    leases = models.ReminderLease.__table__
+    now = datetime.now()
+    db.execute(crud.insert_ignoring_conflicts(db, leases).values(run_key=run_key, shard=shard))
+    result = db.execute(
+        update(leases)
+        .where(
+            leases.c.run_key == run_key,
+            leases.c.shard == shard,
+            leases.c.completed_at.is_(None),
+            or_(leases.c.owner.is_(None), leases.c.owner == WORKER_ID, leases.c.leased_until < now),
+        )
+        .values(owner=WORKER_ID, leased_until=now + LEASE_DURATION)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+def _reopen_lease(db: Session, run_key: str, shard: int) -> None:
+    """Make a finished shard available again, e.g. after reminders were added to it"""
+    leases = models.ReminderLease.__table__
+    db.execute(
+        update(leases)
+        .where(leases.c.run_key == run_key, leases.c.shard == shard, leases.c.completed_at.isnot(None))
+        .values(completed_at=None, owner=None, leased_until=None)
+    )
+    db.commit()
+
+def _complete_lease(db: Session, run_key: str, shard: int) -> None:
+    leases = models.ReminderLease.__table__
+    db.execute(
+        update(leases)
+        .where(leases.c.run_key == run_key, leases.c.shard == shard, leases.c.owner == WORKER_ID)
+        .values(completed_at=datetime.now())
+    )
+    db.commit()
+
+def run_reminders(timezone: str, reminder_date: date) -> Dict[str, int]:
+    """
+    Queue and send reminders for projects on `reminder_date` in one timezone
+
+    Works through every shard this worker can lease. Workers running the
+    same run at once split the shards between them; a shard abandoned by
+    a crashed worker is taken over once its lease expires. Every shard is
+    queued again first, which only adds reminders for projects created or
+    assigned since; a finished shard that gains reminders is reopened and
+    sent, and one that gains none is skipped. Only this run's reminders
+    are sent.
+
+    Args:
+        timezone: IANA timezone of the projects
+        reminder_date: Local date the projects start on
+
+    Returns:
+        Counts of messages sent and of reminders sent and failed by this worker
+    """
+    run_key = f"{timezone}:{reminder_date.isoformat()}"
+    zone = ZoneInfo(timezone)
+    start = _server_local(datetime.combine(reminder_date, time.min, tzinfo=zone))
+    end = _server_local(datetime.combine(reminder_date, time.max, tzinfo=zone))
+
+    totals = {"messages": 0, "sent": 0, "failed": 0}
+    # Start at a random shard so concurrent workers don't contend for the same leases
+    first = random.randrange(REMINDER_SHARDS)
+    for step in range(REMINDER_SHARDS):
+        index = (first + step) % REMINDER_SHARDS
+        shard = (index, REMINDER_SHARDS)
+        with SessionLocal() as db:
+            # Rows already queued for this run are skipped by the outbox's unique key
+            queued = enqueue_project_reminders(db, start, end, reminder_date, timezone=timezone, shard=shard)
+            db.commit()
+            if queued:
+                _reopen_lease(db, run_key, index)
+
+            if not _acquire_lease(db, run_key, index):
+                continue
+
+            while True:
+                counts = drain_outbox(max_batches=1, shard=shard, timezone=timezone, reminder_date=reminder_date)
+                for key, count in counts.items():
+                    totals[key] += count
+                if counts["sent"] + counts["failed"] == 0:
+                    _complete_lease(db, run_key, index)
+                    break
+                # Renew between batches; stop if another worker has taken the shard over
+                if not _acquire_lease(db, run_key, index):
+                    break
+
+    if totals["sent"] or totals["failed"]:
+        print(f"Reminders for {run_key}: {totals['sent']} sent in {totals['messages']} messages, {totals['failed']} failed")
+    return totals
+
+def run_tomorrows_reminders(now: Optional[datetime] = None, only_due: bool = True) -> Dict[str, int]:
+    """
+    Run the reminders for the next local day in every project timezone
+
+    Args:
+        now: Current time (timezone-aware); defaults to now
+        only_due: Skip timezones where it isn't yet REMINDER_LOCAL_TIME
+
+    Returns:
+        Counts summed over all timezones
+    """
+    now = now or datetime.now(dt_timezone.utc)
+    totals = {"messages": 0, "sent": 0, "failed": 0}
+    for timezone in project_timezones():
+        local_now = now.astimezone(ZoneInfo(timezone))
+        if only_due and local_now.time() < REMINDER_LOCAL_TIME:
+            continue
+        for key, count in run_reminders(timezone, local_now.date() + timedelta(days=1)).items():
+            totals[key] += count
+    return totals
+
+class ReminderScheduler:
+    """
+    Long-running scheduler that fires each timezone's run at its local reminder time
+
+    Upcoming runs sit in a heap ordered by UTC fire time, so the loop
+    sleeps exactly until the next one is due. On start, a run whose time
+    has already passed today fires immediately; the lease table keeps
+    that from repeating a finished run.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str, date]] = []
+        self._timezones: Set[str] = set()
+        self._stop = threading.Event()
+
+    def _schedule(self, timezone: str, local_date: date) -> None:
+        fire_at = datetime.combine(local_date, REMINDER_LOCAL_TIME, tzinfo=ZoneInfo(timezone))
+        heapq.heappush(self._heap, (fire_at.astimezone(dt_timezone.utc), timezone, local_date))
+
+    def refresh(self, now: datetime) -> None:
+        """Start scheduling timezones that projects have begun to use"""
+        for timezone in project_timezones():
+            if timezone not in self._timezones:
+                self._timezones.add(timezone)
+                self._schedule(timezone, now.astimezone(ZoneInfo(timezone)).date())
+
+    def run_pending(self, now: datetime) -> None:
+        """Fire every run that is due and schedule its next day"""
+        while self._heap and self._heap[0][0] <= now:
+            _, timezone, local_date = heapq.heappop(self._heap)
+            try:
+                run_reminders(timezone, local_date + timedelta(days=1))
+            except Exception as e:
+                print(f"Error running reminders for {timezone}: {e}")
+            self._schedule(timezone, local_date + timedelta(days=1))
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            now = datetime.now(dt_timezone.utc)
+            try:
+                self.refresh(now)
+            except Exception as e:
+                print(f"Error loading project timezones: {e}")
+            self.run_pending(now)
+
+            wait = REFRESH_INTERVAL.total_seconds()
+            if self._heap:
+                until_next = (self._heap[0][0] - datetime.now(dt_timezone.utc)).total_seconds()
+                wait = max(0.0, min(wait, until_next))
+            self._stop.wait(wait)
+
+    def stop(self) -> None:
+        self._stop.set()
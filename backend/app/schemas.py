@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import List, Optional
 from enum import Enum
 from datetime import datetime
@@ -33,7 +33,7 @@ class UserCreate(UserBase):
 
 class User(UserBase):
     id: int
-    firebase_uid: str
+    firebase_uid: Optional[str] = None  # Unset until an imported contractor signs up
 
     class Config:
         orm_mode = True
@@ -47,6 +47,7 @@ class SubcontractorCreate(SubcontractorBase):
     skill_ids: List[int]
 
 class Subcontractor(SubcontractorBase):
+    hourly_rate: Optional[int] = None  # Unset for contractors imported from a CSV
     id: int
     user: User
     skills: List[Skill]
@@ -95,6 +96,11 @@ class ProjectImage(BaseModel):
     class Config:
         orm_mode = True
 
+class ProjectImageVariants(BaseModel):
+    url: str
+    thumbnail_url: Optional[str] = None
+    web_url: Optional[str] = None
+
 class ProjectBase(BaseModel):
     title: str
     description: Optional[str] = None
@@ -110,6 +116,93 @@ class Project(ProjectBase):
     created_at: datetime
     updated_at: datetime
     images: List[str] = []
+    image_variants: List[ProjectImageVariants] = []
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class ProjectPage(BaseModel):
+    items: List[Project]
+    next_cursor: Optional[str] = None
+
+class ProjectSearchPage(BaseModel):
+    items: List[Project]
+    next_offset: Optional[int] = None
+
+class SubcontractorSearchResult(BaseModel):
+    id: int
+    user_id: int
+    company_name: Optional[str] = None
+    first_name: str
+    last_name: str
+    location: Optional[str] = None
+    hourly_rate: Optional[int] = None
+    has_insurance: Optional[bool] = None
+    skills: List[str] = []
+
+class NearbySubcontractor(BaseModel):
+    id: int
+    user_id: int
+    company_name: Optional[str] = None
+    first_name: str
+    last_name: str
+    location: Optional[str] = None
+    hourly_rate: Optional[int] = None
+    has_insurance: Optional[bool] = None
+    distance_miles: float
+
+class SubcontractorMatch(BaseModel):
+    subcontractor_id: int
+    score: float
+    skill_coverage: float
+    distance_miles: Optional[float] = None
+    hourly_rate: Optional[float] = None
+    has_insurance: bool
+    company_name: Optional[str] = None
+    first_name: str
+    last_name: str
+
+class ProjectAssignmentsUpdate(BaseModel):
+    contractor_ids: List[int]
+
+class ProjectAssignments(BaseModel):
+    project_id: int
+    contractor_ids: List[int]
+
+class SubcontractorSearchPage(BaseModel):
+    items: List[SubcontractorSearchResult]
+    next_offset: Optional[int] = None
+
+class ContractorImportRow(BaseModel):
+    """One row of contractor_template.csv, keyed by its column headers"""
+    company_name: Optional[str] = Field(None, alias="Company Name")
+    contact_person: str = Field(alias="Contact Person")
+    email: EmailStr = Field(alias="Email")
+    phone: Optional[str] = Field(None, alias="Phone")
+    address: Optional[str] = Field(None, alias="Address")
+    city: Optional[str] = Field(None, alias="City")
+    state: Optional[str] = Field(None, alias="State")
+    zip_code: Optional[str] = Field(None, alias="Zip Code")
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def blank_to_none(cls, value):
+        if isinstance(value, str):
+            value = value.strip()
+            return value or None
+        return value
+
+class ContractorImportError(BaseModel):
+    row: int
+    error: str
+
+class ContractorImportJob(BaseModel):
+    id: str
+    status: str  # queued, running, completed, failed
+    processed: int = 0
+    inserted: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: List[ContractorImportError] = []
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,181 @@
+import re
+from sqlalchemy import Column, Integer, MetaData, Table, func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import crud, models
+
+# FTS5 tables created by migration 4; declared here only so queries can join them
+search_metadata = MetaData()
+subcontractor_search = Table('subcontractor_search', search_metadata, Column('rowid', Integer))
+project_search = Table('project_search', search_metadata, Column('rowid', Integer))
+
+# bm25 column weights: company_name, contact_name, location, skills
+SUBCONTRACTOR_WEIGHTS = (4.0, 3.0, 1.0, 2.0)
+# bm25 column weights: title, description, location
+PROJECT_WEIGHTS = (4.0, 1.0, 2.0)
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+def _terms(q: Optional[str]) -> List[str]:
+    return _TERM.findall(q or "")[:16]
+
+def _match_expression(terms: List[str]) -> str:
+    """Build an FTS5 query where every term must match as a prefix"""
+    return " ".join(f'"{term}"*' for term in terms)
+
+def _bm25(table_name: str, weights: Tuple[float, ...]):
+    return func.bm25(literal_column(table_name), *weights).label("rank")
+
+async def search_subcontractors(
+    db: AsyncSession,
+    q: Optional[str] = None,
+    skill_ids: Optional[List[int]] = None,
+    min_rate: Optional[int] = None,
+    max_rate: Optional[int] = None,
+    has_insurance: Optional[bool] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Rank subcontractors by text relevance, then filter by skills and rate
+
+    Args:
+        db: Database session
+        q: Free text matched against company, contact name, location and skills
+        skill_ids: Only subcontractors with at least one of these skills
+        min_rate: Minimum hourly rate
+        max_rate: Maximum hourly rate
+        has_insurance: Only insured (or uninsured) subcontractors
+        limit: Page size
+        offset: Rows to skip
+
+    Returns:
+        The page of results and the offset of the next page, if any
+    """
+    subcontractors = models.Subcontractor.__table__
+    users = models.User.__table__
+    terms = _terms(q)
+
+    columns = [
+        subcontractors.c.id,
+        subcontractors.c.user_id,
+        users.c.company_name,
+        users.c.first_name,
+        users.c.last_name,
+        users.c.location,
+        subcontractors.c.hourly_rate,
+        subcontractors.c.has_insurance,
+    ]
+    query = select(*columns).select_from(subcontractors.join(users, users.c.id == subcontractors.c.user_id))
+
+    if terms and db.get_bind().dialect.name == "sqlite":
+        query = (
+            query.add_columns(_bm25("subcontractor_search", SUBCONTRACTOR_WEIGHTS))
+            .join(subcontractor_search, subcontractor_search.c.rowid == subcontractors.c.id)
+            .where(literal_column("subcontractor_search").op("MATCH")(_match_expression(terms)))
+            .order_by(literal_column("rank"), subcontractors.c.id)
+        )
+    else:
+        for term in terms:
+            pattern = f"%{term}%"
+            query = query.where(or_(
+                users.c.company_name.ilike(pattern),
+                users.c.first_name.ilike(pattern),
+                users.c.last_name.ilike(pattern),
+                users.c.location.ilike(pattern),
+            ))
+        query = query.order_by(subcontractors.c.id.desc())
+
+    if skill_ids:
+        links = models.subcontractor_skills
+        query = query.where(subcontractors.c.id.in_(
+            select(links.c.subcontractor_id).where(links.c.skill_id.in_(skill_ids))
+        ))
+    if min_rate is not None:
+        query = query.where(subcontractors.c.hourly_rate >= min_rate)
+    if max_rate is not None:
+        query = query.where(subcontractors.c.hourly_rate <= max_rate)
+    if has_insurance is not None:
+        query = query.where(subcontractors.c.has_insurance == has_insurance)
+
+    result = await db.execute(query.limit(limit + 1).offset(offset))
+    items = [dict(row) for row in result.mappings().all()]
+    next_offset = offset + limit if len(items) > limit else None
+    items = items[:limit]
+
+    # Skill names for the page in one query
+    skills_by_subcontractor: Dict[int, List[str]] = {item["id"]: [] for item in items}
+    if items:
+        links = models.subcontractor_skills
+        result = await db.execute(
+            select(links.c.subcontractor_id, models.Skill.name)
+            .join(models.Skill, models.Skill.id == links.c.skill_id)
+            .where(links.c.subcontractor_id.in_(skills_by_subcontractor))
+            .order_by(models.Skill.name)
+        )
+        for subcontractor_id, name in result.all():
+            skills_by_subcontractor[subcontractor_id].append(name)
+
+    for item in items:
+        item.pop("rank", None)
+        item["skills"] = skills_by_subcontractor[item["id"]]
+
+    return items, next_offset
+
+async def search_projects(
+    db: AsyncSession,
+    q: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Rank projects by text relevance over title, description and location
+
+    Returns:
+        The page of results and the offset of the next page, if any
+    """
+    projects = models.Project.__table__
+    terms = _terms(q)
+
+    query = select(
+        projects.c.id,
+        projects.c.title,
+        projects.c.description,
+        projects.c.location,
+        projects.c.status,
+        projects.c.project_leader_id,
+        projects.c.created_at,
+        projects.c.updated_at,
+    )
+
+    if terms and db.get_bind().dialect.name == "sqlite":
+        query = (
+            query.add_columns(_bm25("project_search", PROJECT_WEIGHTS))
+            .join(project_search, project_search.c.rowid == projects.c.id)
+            .where(literal_column("project_search").op("MATCH")(_match_expression(terms)))
+            .order_by(literal_column("rank"), projects.c.id.desc())
+        )
+    else:
+        for term in terms:
+            pattern = f"%{term}%"
+            query = query.where(or_(
+                projects.c.title.ilike(pattern),
+                projects.c.description.ilike(pattern),
+                projects.c.location.ilike(pattern),
+            ))
+        query = query.order_by(projects.c.created_at.desc(), projects.c.id.desc())
+
+    if status is not None:
+        query = query.where(projects.c.status == status)
+
+    result = await db.execute(query.limit(limit + 1).offset(offset))
+    items = [dict(row) for row in result.mappings().all()]
+    next_offset = offset + limit if len(items) > limit else None
+    items = items[:limit]
+
+    for item in items:
+        item.pop("rank", None)
+    await crud.attach_project_images(db, items)
+    return items, next_offset
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import models
+from .database import AsyncSessionLocal
+
+# Minimum time between reloads triggered by unknown skill IDs
+SKILL_RELOAD_INTERVAL_SECONDS = float(os.environ.get("SKILL_RELOAD_INTERVAL_SECONDS", "5"))
+
+class SkillCatalog:
+    """
+    Process-wide cache of the skills table
+
+    Loaded on first use and dropped by `invalidate()` after writes. Each
+    worker process holds its own copy, so a skill created through another
+    worker is missing here until the copy is reloaded. `get_many` reloads
+    when asked for an ID it doesn't know, at most once per `reload_interval`
+    so unknown IDs can't force a reload on every request, and looks the
+    IDs up directly in between. Such a skill is never dropped; the listing
+    serves the older copy until the reload.
+    """
+
+    def __init__(self, reload_interval: float = SKILL_RELOAD_INTERVAL_SECONDS):
+        self.reload_interval = reload_interval
+        self._skills: Optional[List[Dict[str, Any]]] = None
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self.etag: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    async def skills(self, db: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+        """
+        All skills ordered by name
+
+        Args:
+            db: Session to load with on a miss; a new one is opened if omitted
+        """
+        skills = self._skills
+        if skills is not None:
+            return skills
+
+        async with self._lock:
+            if self._skills is None:
+                await self._load_with(db)
+            return self._skills
+
+    async def _load_with(self, db: Optional[AsyncSession]) -> None:
+        if db is not None:
+            await self._load(db)
+        else:
+            async with AsyncSessionLocal() as session:
+                await self._load(session)
+
+    async def _load(self, db: AsyncSession) -> None:
+        result = await db.execute(
+            select(models.Skill.id, models.Skill.name, models.Skill.description).order_by(models.Skill.name)
+        )
+        skills = [dict(row) for row in result.mappings().all()]
+        body = json.dumps(skills, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+        self._by_id = {skill["id"]: skill for skill in skills}
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self._skills = skills
+        self._loaded_at = time.monotonic()
+
+    async def _fetch(self, skill_ids: Iterable[int], db: AsyncSession) -> List[Dict[str, Any]]:
+        result = await db.execute(
+            select(models.Skill.id, models.Skill.name, models.Skill.description).where(models.Skill.id.in_(skill_ids))
+        )
+        return [dict(row) for row in result.mappings().all()]
+
+    def invalidate(self) -> None:
+        """Drop the cached catalog; the next read reloads it"""
+        self._skills = None
+
+    async def get_many(self, skill_ids: Iterable[int], db: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+        """
+        Skills for the IDs in `skill_ids`, ordered by name
+
+        An ID missing from the cached copy may be a skill created through
+        another worker, so the catalog is reloaded once before IDs that
+        still don't exist are dropped. Within `reload_interval` of the last
+        load the missing IDs are looked up by primary key instead.
+
+        Args:
+            skill_ids: Skill IDs
+            db: Session to load with on a miss; a new one is opened if omitted
+        """
+        skill_ids = set(skill_ids)
+        await self.skills(db)
+        by_id = self._by_id
+        found = []
+        if not skill_ids.issubset(by_id):
+            reloaded = False
+            async with self._lock:
+                # Another request may have reloaded while we waited
+                if not skill_ids.issubset(self._by_id) and time.monotonic() - self._loaded_at >= self.reload_interval:
+                    await self._load_with(db)
+                    reloaded = True
+            by_id = self._by_id
+            missing = skill_ids.difference(by_id)
+            if missing and not reloaded:
+                if db is not None:
+                    found = await self._fetch(missing, db)
+                else:
+                    async with AsyncSessionLocal() as session:
+                        found = await self._fetch(missing, session)
+        found += [by_id[skill_id] for skill_id in skill_ids if skill_id in by_id]
+        return sorted(found, key=lambda skill: skill["name"])
+
+# Create a singleton instance
+skill_catalog = SkillCatalog()
@@ -0,0 +1,231 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+# Point at a local stand-in server in development and tests
+TWILIO_API_BASE_URL = os.environ.get('TWILIO_API_BASE_URL', 'https://api.twilio.com')
+
+# Public URL of the status callback endpoint; Twilio posts delivery receipts there
+TWILIO_STATUS_CALLBACK_URL = os.environ.get('TWILIO_STATUS_CALLBACK_URL')
+
+# Requests in flight at once; also the connection pool size
+SMS_MAX_CONCURRENCY = int(os.environ.get('SMS_MAX_CONCURRENCY', '16'))
+
+# Sustained messages per second, matching the messaging service's throughput
+SMS_RATE_PER_SECOND = float(os.environ.get('SMS_RATE_PER_SECOND', '10'))
+SMS_BURST = int(os.environ.get('SMS_BURST', str(max(1, int(SMS_RATE_PER_SECOND)))))
+
+# Retries after the first attempt for 429, 5xx and errors connecting
+SMS_MAX_RETRIES = int(os.environ.get('SMS_MAX_RETRIES', '4'))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+REQUEST_TIMEOUT = 10.0
+
+# Errors raised before the request was sent, so retrying can't send a
+# message twice. Read and write errors may come after Twilio accepted the
+# message and are not retried.
+RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class SmsSendError(Exception):
+    """A message was rejected or could not be delivered to the API"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+class SendResult(NamedTuple):
+    to: str
+    sid: Optional[str] = None
+    error: Optional[str] = None
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until a token is available"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    # Full jitter, but never sooner than the server asked for
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+class SmsDispatcher:
+    """
+    Sends SMS through the Twilio Messages API over one pooled HTTP client
+
+    Sends are rate limited by a shared token bucket and retried with
+    jittered exponential backoff on 429, 5xx and errors connecting. A
+    request that fails after it may have reached Twilio is not retried,
+    so a contractor is never sent the same message twice. `send_many`
+    fans out over a bounded thread pool. The client and pool are created
+    on first use.
+    """
+
+    def __init__(
+        self,
+        account_sid: Optional[str],
+        auth_token: Optional[str],
+        messaging_service_sid: Optional[str],
+        base_url: str = TWILIO_API_BASE_URL,
+        max_concurrency: int = SMS_MAX_CONCURRENCY,
+        rate_per_second: float = SMS_RATE_PER_SECOND,
+        burst: int = SMS_BURST,
+        max_retries: int = SMS_MAX_RETRIES,
+        status_callback_url: Optional[str] = TWILIO_STATUS_CALLBACK_URL,
+        timeout: float = REQUEST_TIMEOUT,
+    ):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.messaging_service_sid = messaging_service_sid
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.status_callback_url = status_callback_url
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self._client: Optional[httpx.Client] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        base_url=self.base_url,
+                        auth=(self.account_sid or '', self.auth_token or ''),
+                        limits=httpx.Limits(
+                            max_connections=self.max_concurrency,
+                            max_keepalive_connections=self.max_concurrency,
+                        ),
+                        timeout=self.timeout,
+                    )
+        return self._client
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency, thread_name_prefix='sms'
+                    )
+        return self._executor
+
+    def send(self, to_number: str, body: str) -> str:
+        """
+        Send one message, retrying transient failures
+
+        Args:
+            to_number: The recipient's phone number in E.164 format
+            body: The message content
+
+        Returns:
+            The message SID
+
+        Raises:
+            SmsSendError: If the API rejects the message or retries run out
+        """
+        path = f'/2010-04-01/Accounts/{self.account_sid}/Messages.json'
+        data = {'To': to_number, 'MessagingServiceSid': self.messaging_service_sid, 'Body': body}
+        if self.status_callback_url:
+            data['StatusCallback'] = self.status_callback_url
+
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            retry_after = None
+            try:
+                response = self.client.post(path, data=data)
+            except RETRYABLE_TRANSPORT_ERRORS as e:
+                error = SmsSendError(f'Error connecting to send SMS to {to_number}: {e}')
+            except httpx.TransportError as e:
+                # The message may have been accepted; resending could deliver it twice
+                raise SmsSendError(f'Error sending SMS to {to_number}, delivery unknown: {e}') from e
+            else:
+                if response.status_code < 300:
+                    try:
+                        return response.json()['sid']
+                    except (ValueError, KeyError, TypeError) as e:
+                        raise SmsSendError(
+                            f'SMS to {to_number} was accepted but the response had no SID',
+                            status_code=response.status_code,
+                        ) from e
+
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = {}
+                error = SmsSendError(
+                    payload.get('message') or f'HTTP {response.status_code}',
+                    status_code=response.status_code,
+                    code=payload.get('code'),
+                )
+                if response.status_code != 429 and response.status_code < 500:
+                    raise error
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt >= self.max_retries:
+                raise error
+            time.sleep(_retry_delay(attempt, retry_after))
+            attempt += 1
+
+    def _send_result(self, message: Tuple[str, str]) -> SendResult:
+        to_number, body = message
+        try:
+            return SendResult(to_number, sid=self.send(to_number, body))
+        except Exception as e:
+            # One bad message must not abort the rest of the batch
+            return SendResult(to_number, error=str(e))
+
+    def send_many(self, messages: Iterable[Tuple[str, str]]) -> List[SendResult]:
+        """
+        Send messages concurrently
+
+        Args:
+            messages: (to_number, body) pairs
+
+        Returns:
+            One result per message, in the same order; a message that
+            failed for any reason has `error` set instead of `sid`
+        """
+        return list(self.executor.map(self._send_result, messages))
+
+    def close(self) -> None:
+        """Close pooled connections and stop the worker threads"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._client is not None:
+                self._client.close()
+                self._client = None
@@ -0,0 +1,92 @@
+import math
+from typing import List
+
+# GSM 03.38 basic character set; each costs one septet
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# Extension table; each costs an escape plus the character
+GSM7_EXTENDED = set("^{}\\[~]|€\f")
+
+# Characters per segment for a single message and for each part of a long one
+GSM7_SINGLE, GSM7_MULTI = 160, 153
+UCS2_SINGLE, UCS2_MULTI = 70, 67
+
+# Lookalikes that would otherwise force the whole message into UCS-2
+_GSM7_SUBSTITUTES = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201b": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"',
+    "\u2013": "-", "\u2014": "-", "\u2212": "-",
+    "\u2026": "...",
+    "\u00a0": " ", "\u202f": " ", "\u200b": "",
+    "\u2022": "-", "\u00b7": "-",
+    "\t": " ",
+})
+
+def to_gsm7(text: str) -> str:
+    """Replace typographic quotes, dashes and spaces with their GSM-7 equivalents"""
+    return text.translate(_GSM7_SUBSTITUTES)
+
+def is_gsm7(text: str) -> bool:
+    return all(char in GSM7_BASIC or char in GSM7_EXTENDED for char in text)
+
+def _units(text: str, gsm: bool) -> List[int]:
+    """Cost of each character in the message's encoding"""
+    if gsm:
+        return [2 if char in GSM7_EXTENDED else 1 for char in text]
+    # UTF-16 code units; characters outside the BMP take a surrogate pair
+    return [2 if ord(char) > 0xFFFF else 1 for char in text]
+
+def segment_count(text: str) -> int:
+    """
+    Number of billable segments Twilio will split a message into
+
+    A character is never split across segments, so escaped GSM-7
+    characters and surrogate pairs may leave a unit unused at a boundary.
+    """
+    if not text:
+        return 1
+
+    gsm = is_gsm7(text)
+    units = _units(text, gsm)
+    single, multi = (GSM7_SINGLE, GSM7_MULTI) if gsm else (UCS2_SINGLE, UCS2_MULTI)
+    if sum(units) <= single:
+        return 1
+
+    segments, used = 1, 0
+    for cost in units:
+        if used + cost > multi:
+            segments += 1
+            used = 0
+        used += cost
+    return segments
+
+def fits(text: str, max_segments: int) -> bool:
+    return segment_count(text) <= max_segments
+
+def truncate_to_segments(text: str, max_segments: int, suffix: str = "...") -> str:
+    """
+    Cut a message so it fits in `max_segments`, ending with `suffix` if cut
+
+    Args:
+        text: Message to shorten
+        max_segments: Segment budget
+        suffix: Appended when the text is cut
+
+    Returns:
+        The text unchanged if it already fits, otherwise the longest prefix
+        (trimmed of trailing whitespace) plus `suffix` that does
+    """
+    if fits(text, max_segments):
+        return text
+
+    # Segment count only grows with length, so binary search the cut point
+    low, high = 0, len(text)
+    while low < high:
+        middle = math.ceil((low + high) / 2)
+        if fits(text[:middle].rstrip() + suffix, max_segments):
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + suffix
@@ -0,0 +1,113 @@
+import os
+import string
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .notification_outbox import DEFAULT_PROJECT_TIMEZONE
+from .phone import normalize_phone
+
+# Public URL of the inbound SMS endpoint, if it differs from the URL the app sees
+TWILIO_INBOUND_URL = os.environ.get('TWILIO_INBOUND_URL')
+
+# First word of a reply; opt-out words such as STOP and CANCEL are left to Twilio
+CONFIRM_WORDS = {"yes", "y", "confirm", "confirmed", "ok", "okay"}
+DECLINE_WORDS = {"no", "n", "decline", "declined"}
+
+def parse_reply(body: Optional[str]) -> Optional[str]:
+    """
+    Read a contractor's reply to a reminder
+
+    Returns:
+        "confirmed", "declined", or None if the reply is neither
+    """
+    words = (body or "").split()
+    if not words:
+        return None
+    word = words[0].strip(string.punctuation).lower()
+    if word in CONFIRM_WORDS:
+        return "confirmed"
+    if word in DECLINE_WORDS:
+        return "declined"
+    return None
+
+def _local_today(timezone: str) -> date:
+    try:
+        zone = ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        zone = ZoneInfo(DEFAULT_PROJECT_TIMEZONE)
+    return datetime.now(zone).date()
+
+async def handle_reply(db: AsyncSession, from_number: str, body: Optional[str]) -> Optional[str]:
+    """
+    Record a contractor's confirm/decline reply against their next project
+
+    The reply applies to the sent reminders for the earliest project date
+    that is today or later in the project's timezone; reminders for
+    projects that have already happened are never answered. The sender
+    is found by the unique index on users.phone_e164, and the reminders
+    by the outbox index on (contractor_id, reminder_date), so routing a
+    reply never scans either table. The caller commits.
+
+    Args:
+        db: Database session
+        from_number: The sender's number as Twilio reports it
+        body: The message text
+
+    Returns:
+        The text to reply with, or None to send no reply
+    """
+    phone = normalize_phone(from_number)
+    if phone is None:
+        return None
+
+    users = models.User.__table__
+    result = await db.execute(select(users.c.id, users.c.first_name).where(users.c.phone_e164 == phone))
+    user = result.first()
+    if user is None:
+        return None
+
+    response = parse_reply(body)
+    if response is None:
+        return "Reply YES to confirm or NO to decline your upcoming project."
+
+    outbox = models.NotificationOutbox.__table__
+    projects = models.Project.__table__
+    # No timezone is more than a day behind UTC; each row is checked against its own below
+    earliest = datetime.now(dt_timezone.utc).date() - timedelta(days=1)
+    result = await db.execute(
+        select(
+            outbox.c.id,
+            outbox.c.reminder_date,
+            func.coalesce(projects.c.timezone, DEFAULT_PROJECT_TIMEZONE),
+        )
+        .select_from(outbox.join(projects, projects.c.id == outbox.c.project_id))
+        .where(
+            outbox.c.contractor_id == user.id,
+            outbox.c.reminder_date >= earliest,
+            outbox.c.status == "sent",
+        )
+    )
+    upcoming = [
+        (reminder_date, id)
+        for id, reminder_date, timezone in result.all()
+        if reminder_date >= _local_today(timezone)
+    ]
+    if not upcoming:
+        return "You have no upcoming projects to confirm."
+
+    reminder_date = min(upcoming)[0]
+    result = await db.execute(
+        update(outbox)
+        .where(outbox.c.id.in_([id for day, id in upcoming if day == reminder_date]))
+        .values(response=response, responded_at=datetime.now())
+    )
+    count = "your project" if result.rowcount == 1 else f"your {result.rowcount} projects"
+    day = reminder_date.strftime("%A %b %d").replace(" 0", " ")
+    if response == "confirmed":
+        return f"Thanks {user.first_name}, you're confirmed for {count} on {day}."
+    return f"Thanks {user.first_name}, we've noted you can't make {count} on {day}."
@@ -1,22 +1,29 @@
-from twilio.rest import Client
 import os
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from . import models
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+from . import sms_format
+from .phone import normalize_phone
+from .sms_dispatcher import SendResult, SmsDispatcher
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
 
 # Twilio credentials from environment variables
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
 TWILIO_MESSAGING_SERVICE_SID = os.environ.get('TWILIO_MESSAGING_SERVICE_SID')
 
+# Billable segments a reminder may use
+SMS_MAX_SEGMENTS = int(os.environ.get('SMS_MAX_SEGMENTS', '2'))
+
 class TwilioService:
     """Service to handle Twilio SMS notifications"""
 
     def __init__(self):
-        """Initialize the Twilio client with credentials"""
+        """Initialize the SMS dispatcher with credentials"""
         if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_MESSAGING_SERVICE_SID]):
             print("Warning: Twilio credentials not fully configured in environment variables")
-        self.client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        self.dispatcher = SmsDispatcher(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_MESSAGING_SERVICE_SID)
 
     def send_message(self, to_number: str, message: str) -> str:
         """
@@ -30,16 +37,30 @@ class TwilioService:
             The message SID if successful
         """
         try:
-            message = self.client.messages.create(
-                messaging_service_sid=TWILIO_MESSAGING_SERVICE_SID,
-                body=message,
-                to=to_number
-            )
-            return message.sid
+            return self.dispatcher.send(to_number, message)
         except Exception as e:
             print(f"Error sending SMS: {str(e)}")
             raise e
 
+    def send_messages(self, messages: Iterable[Tuple[str, str]]) -> List[SendResult]:
+        """
+        Send many SMS messages concurrently
+
+        Sends share the dispatcher's connection pool, concurrency cap and
+        rate limit. A failed send doesn't stop the others.
+
+        Args:
+            messages: (to_number, message) pairs with numbers in E.164 format
+
+        Returns:
+            One result per message, in the same order
+        """
+        results = self.dispatcher.send_many(messages)
+        for result in results:
+            if result.error:
+                print(f"Error sending SMS to {result.to}: {result.error}")
+        return results
+
     def format_project_message(self, project, contractor_name: str) -> str:
         """
         Format the project details message
@@ -66,10 +87,135 @@ class TwilioService:
 
         return message
 
-    def notify_contractor_for_project(self, db: Session, contractor_id: str, project) -> bool:
+    def format_project_digest(self, projects: List, contractor_name: str, max_segments: int = SMS_MAX_SEGMENTS) -> str:
+        """
+        Format one reminder covering all of a contractor's projects
+
+        The most detailed version that fits in `max_segments` is used:
+        the full message for a single project, then one line per project
+        with location and details, with location only, with titles only,
+        then titles for the first few projects plus a count of the rest.
+        Typographic punctuation is replaced so the text stays in GSM-7.
+
+        Args:
+            projects: The project details (title, location, description)
+            contractor_name: The contractor's name
+            max_segments: SMS segment budget
+
+        Returns:
+            The message text
+        """
+        def line(project, detail: int) -> str:
+            text = f"- {project.title}"
+            if detail >= 1 and project.location:
+                text += f" @ {project.location}"
+            if detail >= 2 and getattr(project, 'description', None):
+                text += f": {project.description}"
+            return text
+
+        count = "a project" if len(projects) == 1 else f"{len(projects)} projects"
+        header = f"Hi {contractor_name}, reminder: you have {count} starting tomorrow:"
+
+        candidates = []
+        if len(projects) == 1:
+            candidates.append(self.format_project_message(projects[0], contractor_name))
+        for detail in (2, 1, 0):
+            candidates.append("\n".join([header] + [line(project, detail) for project in projects]))
+        for shown in range(len(projects) - 1, 0, -1):
+            candidates.append("\n".join(
+                [header] + [line(project, 0) for project in projects[:shown]] + [f"+{len(projects) - shown} more"]
+            ))
+
+        for candidate in candidates:
+            candidate = sms_format.to_gsm7(candidate)
+            if sms_format.fits(candidate, max_segments):
+                return candidate
+        return sms_format.truncate_to_segments(sms_format.to_gsm7(candidates[-1]), max_segments)
+
+    def prepare_project_digest(self, projects: List, contractor_name: str, phone: str) -> Optional[Tuple[str, str]]:
+        """
+        Build the recipient number and body of a contractor's reminder
+
+        Args:
+            projects: The project details (title, location, description)
+            contractor_name: The contractor's name
+            phone: The contractor's phone number, preferably the stored E.164 form
+
+        Returns:
+            (to_number, message), or None if the contractor has no usable phone number
+        """
+        to_number = normalize_phone(phone)
+        if not to_number:
+            print(f"Cannot send notification: {contractor_name} has no valid phone number")
+            return None
+
+        return to_number, self.format_project_digest(projects, contractor_name)
+
+    def send_project_digests(self, digests: Iterable[Tuple[List, str, str]]) -> List[Optional[SendResult]]:
+        """
+        Send one reminder per contractor covering all of their projects
+
+        Messages go out concurrently through the dispatcher.
+
+        Args:
+            digests: (projects, contractor_name, phone) triples; projects need
+                title, location and description
+
+        Returns:
+            The send result for each digest in the same order, or None
+            where the contractor has no phone number
+        """
+        results: List[Optional[SendResult]] = []
+        messages = []
+        recipients = []
+        for projects, contractor_name, phone in digests:
+            message = self.prepare_project_digest(projects, contractor_name, phone)
+            if message is not None:
+                messages.append(message)
+                recipients.append((len(results), contractor_name, sms_format.segment_count(message[1])))
+            results.append(None)
+
+        for (index, contractor_name, segments), result in zip(recipients, self.dispatcher.send_many(messages)):
+            if result.error:
+                print(f"Failed to send notification to {contractor_name} ({result.to}): {result.error}")
+            else:
+                print(f"Notification sent to {contractor_name} ({result.to}, {segments} segments) - SID: {result.sid}")
+            results[index] = result
+        return results
+
+    def send_project_reminders(self, reminders: Iterable[Tuple[object, str, str]]) -> List[Optional[SendResult]]:
+        """
+        Send one reminder per (project, contractor_name, phone) triple
+
+        Returns:
+            The send result for each reminder, as for `send_project_digests`
+        """
+        return self.send_project_digests(
+            [([project], contractor_name, phone) for project, contractor_name, phone in reminders]
+        )
+
+    def send_project_reminder(self, project, contractor_name: str, phone: str) -> bool:
+        """
+        Send a project reminder to a contractor whose details are already loaded
+
+        Args:
+            project: The project details (title, location, description)
+            contractor_name: The contractor's name
+            phone: The contractor's phone number as stored
+
+        Returns:
+            True if notification was sent successfully
+        """
+        result = self.send_project_reminders([(project, contractor_name, phone)])[0]
+        return result is not None and result.error is None
+
+    def notify_contractor_for_project(self, db: "Session", contractor_id: str, project) -> bool:
         """
         Send a notification to a contractor about an upcoming project
 
+        Prefer `send_project_reminder` when the contractor's name and phone
+        have already been loaded, e.g. by a joined query.
+
         Args:
             db: Database session
             contractor_id: The contractor's ID
@@ -78,6 +224,9 @@ class TwilioService:
         Returns:
             True if notification was sent successfully
         """
+        # Imported here so sending a text doesn't load SQLAlchemy
+        from . import models
+
         # Retrieve contractor details from database
         contractor = db.query(models.User).filter(models.User.id == contractor_id).first()
 
@@ -85,22 +234,9 @@ class TwilioService:
             print(f"Cannot send notification: Contractor {contractor_id} not found or no phone number")
             return False
 
-        # Format the phone number for Twilio (add +1 if needed)
-        phone = contractor.phone
-        if not phone.startswith('+'):
-            phone = '+1' + phone.replace('-', '').replace(' ', '')
-
-        # Format the message
-        message = self.format_project_message(project, f"{contractor.first_name} {contractor.last_name}")
-
-        # Send the message
-        try:
-            message_sid = self.send_message(phone, message)
-            print(f"Notification sent to {contractor.first_name} {contractor.last_name} ({phone}) - SID: {message_sid}")
-            return True
-        except Exception as e:
-            print(f"Failed to send notification: {str(e)}")
-            return False
+        return self.send_project_reminder(
+            project, f"{contractor.first_name} {contractor.last_name}", contractor.phone_e164 or contractor.phone
+        )
 
 # Create a singleton instance
 twilio_service = TwilioService()
\ No newline at end of file
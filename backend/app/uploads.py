@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from typing import Iterable, List
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Root directory for uploaded files, served under /uploads
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+UPLOAD_URL_PREFIX = "/uploads"
+
+# Per-image and per-request limits
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+MAX_IMAGES_PER_PROJECT = int(os.environ.get("MAX_IMAGES_PER_PROJECT", "40"))
+
+# Whole request body of an image upload, checked before it is spooled to disk
+MAX_UPLOAD_REQUEST_BYTES = int(os.environ.get("MAX_UPLOAD_REQUEST_BYTES", str(200 * 1024 * 1024)))
+
+# Chunk size used when copying an upload to its final location
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Images written to disk at the same time for one request
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,8}$")
+
+# Originals (<sha256>.<ext>) and their variants (<sha256>_<variant>.webp)
+# never change once written, so clients may cache them indefinitely
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}(?:_[a-z]+)?(?:\.[a-z0-9]{1,8})?$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Older uploads named <project id>_<uuid>.<ext>
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+
+class UploadTooLarge(Exception):
+    pass
+
+def _extension(filename: str) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if _EXTENSION.match(extension) else ""
+
+def content_path(digest: str, extension: str) -> str:
+    """Sharded relative path for a content hash, e.g. ab/cd/abcd...jpg"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+def _store(source, extension: str, upload_dir: str, max_bytes: int) -> str:
+    """
+    Copy an upload to its content-addressed location in fixed-size chunks
+
+    The file is hashed while it is written to a temp file in the upload
+    directory, then renamed into place. If the same content is already
+    stored, the temp file is discarded.
+
+    Raises:
+        UploadTooLarge: If the upload exceeds `max_bytes`
+    """
+    incoming = os.path.join(upload_dir, ".incoming")
+    os.makedirs(incoming, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=incoming)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        source.seek(0)
+        with os.fdopen(fd, "wb") as destination:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                destination.write(chunk)
+
+        relative_path = content_path(digest.hexdigest(), extension)
+        final_path = os.path.join(upload_dir, relative_path)
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+        return relative_path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+async def store_images(
+    images: List[UploadFile],
+    upload_dir: str = UPLOAD_DIR,
+    max_bytes: int = MAX_IMAGE_BYTES,
+) -> List[str]:
+    """
+    Store uploaded images under content-hash names
+
+    Files are copied in worker threads, a few at a time, so the event loop
+    never blocks on disk I/O and no image is held in memory whole.
+    Identical photos map to the same file and are stored once.
+
+    Args:
+        images: Uploaded files, in the order they should be listed
+        upload_dir: Root directory for stored files
+        max_bytes: Size limit per image
+
+    Returns:
+        URLs of the stored images, in the same order as `images`
+
+    Raises:
+        HTTPException: 413 if there are too many images or one is too large
+    """
+    if len(images) > MAX_IMAGES_PER_PROJECT:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_IMAGES_PER_PROJECT} images can be uploaded at once"
+        )
+    for image in images:
+        # The multipart parser records the size, so oversized files fail
+        # before any copying; UploadSizeLimit bounds what it spools
+        if image.size is not None and image.size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"{image.filename} exceeds {max_bytes} bytes")
+
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def store(image: UploadFile) -> str:
+        async with semaphore:
+            try:
+                path = await run_in_threadpool(
+                    _store, image.file, _extension(image.filename), upload_dir, max_bytes
+                )
+            except UploadTooLarge:
+                raise HTTPException(status_code=413, detail=f"{image.filename} exceeds {max_bytes} bytes")
+            return path
+
+    stored = await asyncio.gather(*[store(image) for image in images])
+    return [f"{UPLOAD_URL_PREFIX}/{path}" for path in stored]
+
+class UploadSizeLimit:
+    """
+    Rejects upload requests whose body exceeds a limit with a 413
+
+    The multipart parser spools every file to disk before the endpoint
+    runs, so `store_images` only sees an oversized image after it has been
+    written out. This middleware turns such requests away first: on their
+    Content-Length when it is sent, otherwise as soon as the bytes read
+    pass the limit.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str], max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Uploads are limited to {self.max_bytes} bytes per request"
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the endpoint reads its form, so the app's
+                    # exception handler renders it
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+class UploadFiles(StaticFiles):
+    """
+    Serves /uploads with caching suited to content-addressed files
+
+    FileResponse already handles Range and If-Range requests and hands the
+    file to the server's sendfile path where the server supports it.
+    Content-addressed files get their name as a strong ETag, so it is the
+    same on every server, and an immutable Cache-Control. Temp files from
+    uploads and renders in progress are never served.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        parts = path.replace("\\", "/").split("/")
+        if any(part.startswith(".") for part in parts) or path.endswith(".tmp"):
+            raise StarletteHTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+        name = os.path.basename(full_path)
+        if _CONTENT_ADDRESSED.match(name):
+            response.headers["etag"] = f'"{name}"'
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["cache-control"] = DEFAULT_CACHE_CONTROL
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Geocoding check for free-text locations
+Usage: python check_geocoding.py
+
+Resolves the address shapes users and the contractor importer produce
+with the shipped centroid tables and fails if any of them lands more
+than MAX_ERROR_MILES from where it should, or in the wrong timezone.
+House numbers that look like ZIP codes must not be taken for one.
+"""
+
+import sys
+
+from app import geo
+
+# ZIP and city centroids are within a few miles of the places below
+MAX_ERROR_MILES = 25
+
+HOUSTON = (29.76, -95.37)
+AUSTIN = (30.27, -97.74)
+NEW_YORK = (40.71, -74.01)
+SEATTLE = (47.61, -122.33)
+BOISE = (43.62, -116.20)
+
+# (location, expected coordinate, expected timezone)
+CASES = [
+    # House numbers that are also real ZIP codes (Manhattan, Schenectady)
+    ("10001 Westheimer Rd, Houston, TX 77042", HOUSTON, "America/Chicago"),
+    ("12345 Ranch Rd, Austin, TX", AUSTIN, "America/Chicago"),
+    ("10001 Westheimer Rd, Houston, TX 77042, USA", HOUSTON, "America/Chicago"),
+    # Contractor import: "address, city, ST zip"
+    ("98101 Main St, Austin, TX 78701", AUSTIN, "America/Chicago"),
+    ("123 Main St, New York, NY 10001", NEW_YORK, "America/New_York"),
+    ("Austin, TX 78701-1234", AUSTIN, "America/Chicago"),
+    ("Seattle WA 98101", SEATTLE, "America/Los_Angeles"),
+    ("Boise, ID 83702", BOISE, "America/Boise"),
+    ("78701", AUSTIN, "America/Chicago"),
+    ("Austin TX", AUSTIN, "America/Chicago"),
+]
+
+def main():
+    failures = 0
+    for location, (latitude, longitude), timezone in CASES:
+        centroid = geo.geocode(location)
+        if centroid is None:
+            print(f"FAIL: {location!r} did not resolve")
+            failures += 1
+            continue
+
+        miles = geo.haversine_miles(latitude, longitude, centroid.latitude, centroid.longitude)
+        resolved_timezone = geo.timezone_for(location)
+        print(f"  {location!r}: {centroid.latitude:.3f}, {centroid.longitude:.3f} ({miles:.1f} mi), {resolved_timezone}")
+        if miles > MAX_ERROR_MILES:
+            print(f"FAIL: {location!r} resolved {miles:.0f} miles from where it should")
+            failures += 1
+        if resolved_timezone != timezone:
+            print(f"FAIL: {location!r} should be in {timezone}, got {resolved_timezone}")
+            failures += 1
+
+    print("All locations resolve" if not failures else f"{failures} checks failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the Firebase Functions entry point (main.py)
+Usage: python check_import_time.py [budget_ms]
+
+Imports main.py in fresh interpreters with -X importtime and fails if:
+- a module that should only load on first use is imported eagerly, or
+- our own import time, excluding the Firebase Functions framework that
+  every instance needs, exceeds the budget (default 50 ms, or
+  IMPORT_TIME_BUDGET_MS).
+"""
+
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Loaded by the functions that use them, never by importing main.py
+LAZY_MODULES = [
+    "sqlalchemy",
+    "twilio",
+    "google.cloud.firestore",
+    "PIL",
+    "numpy",
+    "app.database",
+    "app.models",
+    "app.reminder_scheduler",
+    "app.notification_outbox",
+    "app.twilio_service",
+    "app.firebase_adapter",
+]
+
+# Imported by every function instance and outside our control
+FRAMEWORK_PREFIXES = ("firebase_functions", "firebase_admin", "flask", "werkzeug", "google", "yaml")
+
+RUNS = 3
+
+def measure() -> List[Tuple[int, int, int, str]]:
+    """Import main.py once and return (depth, self_us, cumulative_us, module) per import"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit("Error: importing main.py failed")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((depth, int(own), int(cumulative), name.strip()))
+    return imports
+
+def own_time(imports: List[Tuple[int, int, int, str]]) -> Dict[str, int]:
+    """Time spent in main.py itself and in each of its direct imports that isn't the framework"""
+    # A module's imports are listed before it, one level deeper
+    index = next(i for i, (depth, own, cumulative, name) in enumerate(imports) if depth == 0 and name == "main")
+    times = {"main": imports[index][1]}
+    for depth, own, cumulative, name in reversed(imports[:index]):
+        if depth == 0:
+            break
+        if depth == 1 and not name.startswith(FRAMEWORK_PREFIXES):
+            times[name] = cumulative
+    return times
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else float(os.environ.get("IMPORT_TIME_BUDGET_MS", "50"))
+
+    runs = [measure() for _ in range(RUNS)]
+    # The fastest run is the least disturbed by the rest of the machine
+    best = min(runs, key=lambda imports: sum(own_time(imports).values()))
+    own = own_time(best)
+    total_ms = next(cumulative for depth, _, cumulative, name in best if depth == 0 and name == "main") / 1000
+    own_ms = sum(own.values()) / 1000
+
+    print(f"import main: {total_ms:.1f} ms total, {own_ms:.1f} ms excluding the Firebase framework (budget {budget_ms:.0f} ms)")
+    for name, cumulative in sorted(own.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failures = 0
+    loaded = {name for _, _, _, name in best}
+    for module in LAZY_MODULES:
+        eager = sorted(name for name in loaded if name == module or name.startswith(module + "."))
+        if eager:
+            print(f"FAIL: {module} is imported by main.py; import it inside the function that needs it")
+            failures += 1
+
+    if own_ms > budget_ms:
+        print(f"FAIL: import time {own_ms:.1f} ms is over the {budget_ms:.0f} ms budget")
+        failures += 1
+
+    print("Import time within budget" if not failures else f"{failures} checks failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Query plan check for the hot-path indexes
+Usage: python check_query_plans.py
+
+Builds a fresh database in a temporary directory with the migrations,
+runs EXPLAIN QUERY PLAN on the hot queries and fails if any of them
+doesn't search the index it was built for, or sorts in a temporary
+B-tree instead of reading in index order.
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, create_engine, or_, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.migrations import migrate
+from app.notification_outbox import enqueue_statement
+
+def hot_queries(db: Session):
+    """(description, statement, index it must search) for each hot query"""
+    projects = models.Project.__table__
+    now = datetime.now()
+    yesterday = now - timedelta(days=1)
+    page = select(projects.c.id, projects.c.title, projects.c.created_at).order_by(
+        projects.c.created_at.desc(), projects.c.id.desc()
+    ).limit(21)
+    after = and_(
+        projects.c.created_at <= now,
+        or_(projects.c.created_at < now, and_(projects.c.created_at == now, projects.c.id < 100)),
+    )
+
+    queries = [
+        ("projects page by status", page.where(projects.c.status == "in_progress"), "ix_projects_status_created_at"),
+        ("projects next page by status", page.where(projects.c.status == "in_progress", after), "ix_projects_status_created_at"),
+        ("projects page by leader", page.where(projects.c.project_leader_id == 1), "ix_projects_leader_created_at"),
+        ("projects next page by leader", page.where(projects.c.project_leader_id == 1, after), "ix_projects_leader_created_at"),
+        ("projects next page", page.where(after), "ix_projects_created_at"),
+        # The scheduler's own statement, as run per timezone and shard
+        (
+            "reminders due",
+            enqueue_statement(db, yesterday, now, now.date()),
+            "ix_projects_status_created_at",
+        ),
+        (
+            "reminders due in one timezone and shard",
+            enqueue_statement(db, yesterday, now, now.date(), timezone="America/Chicago", shard=(0, 8)),
+            "ix_projects_status_created_at",
+        ),
+    ]
+
+    for links, owner in [
+        (models.subcontractor_skills, "subcontractor_id"),
+        (models.project_leader_skills, "project_leader_id"),
+    ]:
+        queries.append((
+            f"{links.name} by owner",
+            select(links.c.skill_id).where(links.c[owner] == 1),
+            f"uq_{links.name}_pair",
+        ))
+        queries.append((
+            f"{links.name} by skill",
+            select(links.c[owner]).where(links.c.skill_id.in_([1, 2, 3])),
+            f"ix_{links.name}_skill",
+        ))
+    return queries
+
+def explain(conn, statement) -> list:
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+
+def main():
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'plans.db')}")
+        migrate(engine)
+
+        with Session(engine) as db:
+            conn = db.connection()
+            for description, statement, index in hot_queries(db):
+                plan = explain(conn, statement)
+                # "SEARCH projects USING INDEX ix_... (status=? AND created_at>?)"
+                used = any(step.startswith("SEARCH") and f"INDEX {index} " in f"{step} " for step in plan)
+                sorted_in_memory = any("TEMP B-TREE" in step for step in plan)
+                print(f"  {description}: {' / '.join(plan)}")
+                if not used:
+                    print(f"FAIL: {description} should search {index}")
+                    failures += 1
+                if sorted_in_memory:
+                    print(f"FAIL: {description} sorts in a temporary B-tree")
+                    failures += 1
+        engine.dispose()
+
+    print("All queries use their indexes" if not failures else f"{failures} checks failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,24 +2,44 @@
 # To get started, simply uncomment the below code or create your own.
 # Deploy with `firebase deploy`
 
-from firebase_functions import https_fn, scheduler_fn
-from firebase_admin import initialize_app
-from app.notification_scheduler import scheduled_project_notifications, check_notifications
-from twilio.rest import Client
 import os
 import json
 from dotenv import load_dotenv
-from app.twilio_service import twilio_service
 
-# Load environment variables from .env file
+# Load environment variables from .env file, before any app module reads its settings
 load_dotenv()
 
-# Initialize Firebase app
-try:
-    initialize_app()
-except ValueError:
-    # App already initialized
-    pass
+from firebase_functions import https_fn, options, scheduler_fn
+from app.notification_scheduler import scheduled_project_notifications, check_notifications
+from app.phone import normalize_phone
+
+# Heavier dependencies are imported on first use, so each function instance
+# only loads what its function needs. Run check_import_time.py after adding imports.
+
+def _twilio_service():
+    """The shared Twilio service, created on first use"""
+    from app.twilio_service import twilio_service
+    return twilio_service
+
+def _caller_uid(req: https_fn.Request):
+    """Firebase UID of the signed-in caller, or None without a valid ID token"""
+    scheme, _, token = req.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+
+    import firebase_admin
+    from firebase_admin import auth
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
+    try:
+        return auth.verify_id_token(token)['uid']
+    except (ValueError, auth.InvalidIdTokenError):
+        return None
+
+# Browsers may call the texting endpoints from any origin; the framework answers preflight requests
+TEXT_CORS = options.CorsOptions(cors_origins="*", cors_methods=["post"])
 
 # Simple health check endpoint
 @https_fn.on_request()
@@ -33,7 +53,7 @@ def test_twilio(req: https_fn.Request) -> https_fn.Response:
         # Get the phone number from the request or use a default
         phone_number = req.args.get('phone', '+1234567890')  # Placeholder phone number
 
-        # Setup Twilio client
+        # Check Twilio credentials
         account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
         auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
         messaging_service_sid = os.environ.get('TWILIO_MESSAGING_SERVICE_SID')
@@ -41,21 +61,15 @@ def test_twilio(req: https_fn.Request) -> https_fn.Response:
         if not all([account_sid, auth_token, messaging_service_sid]):
             return https_fn.Response("Twilio credentials not properly configured", status=500)
 
-        client = Client(account_sid, auth_token)
+        # Send through the shared dispatcher so warm instances reuse its connections
+        message_sid = _twilio_service().send_message(phone_number, 'Test message from Handy App!')
 
-        # Send the message
-        message = client.messages.create(
-            messaging_service_sid=messaging_service_sid,
-            body='Test message from Handy App!',
-            to=phone_number
-        )
-
-        return https_fn.Response(f"Message sent! SID: {message.sid}")
+        return https_fn.Response(f"Message sent! SID: {message_sid}")
     except Exception as e:
         return https_fn.Response(f"Error sending message: {str(e)}", status=500)
 
 # Endpoint to send a text message to a contractor
-@https_fn.on_request(cors=True)
+@https_fn.on_request(cors=TEXT_CORS)
 def send_text(req: https_fn.Request) -> https_fn.Response:
     # Handle preflight requests for CORS
     if req.method == 'OPTIONS':
@@ -99,15 +113,20 @@ def send_text(req: https_fn.Request) -> https_fn.Response:
                 headers={"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
             )
 
-        # Format the phone number for Twilio (add +1 if needed)
-        if not phone_number.startswith('+'):
-            phone_number = '+1' + phone_number.replace('-', '').replace(' ', '')
+        # Format the phone number for Twilio
+        phone_number = normalize_phone(phone_number)
+        if not phone_number:
+            return https_fn.Response(
+                json.dumps({"error": "Phone number is not valid"}),
+                status=400,
+                headers={"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+            )
 
         # Format message if needed
         formatted_message = f"Hello {contractor_name}, {message}"
 
         # Send the message using our Twilio service
-        message_sid = twilio_service.send_message(phone_number, formatted_message)
+        message_sid = _twilio_service().send_message(phone_number, formatted_message)
 
         # Return success response
         return https_fn.Response(
@@ -126,6 +145,96 @@ def send_text(req: https_fn.Request) -> https_fn.Response:
             headers={"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
         )
 
+# Most recipients one send_text_batch call may message
+MAX_BATCH_RECIPIENTS = 200
+
+# Endpoint to send a text message to many contractors at once
+@https_fn.on_request(cors=TEXT_CORS)
+def send_text_batch(req: https_fn.Request) -> https_fn.Response:
+    """
+    Send a templated text to a list of recipients in parallel
+
+    Callers must be signed in: send a Firebase ID token as
+    `Authorization: Bearer <token>`.
+
+    Request body:
+        {"recipients": [{"phoneNumber": "...", "contractorName": "..."}, ...],
+         "message": "Crew meeting at 7am"}
+
+    `{name}` in the message is replaced by each recipient's name; without
+    it the text starts "Hello <name>, " as send_text does. Numbers are
+    normalized and each distinct number is texted once.
+
+    Returns one result per recipient, in request order.
+    """
+    headers = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+
+    if req.method != 'POST':
+        return https_fn.Response(json.dumps({"error": "Only POST method is allowed"}), status=405, headers=headers)
+
+    try:
+        if _caller_uid(req) is None:
+            return https_fn.Response(json.dumps({"error": "Sign in to send text messages"}), status=401, headers=headers)
+
+        request_data = req.get_json(silent=True) or {}
+        recipients = request_data.get('recipients')
+        template = request_data.get('message', 'Hey')
+
+        if not isinstance(template, str):
+            return https_fn.Response(json.dumps({"error": "message must be a string"}), status=400, headers=headers)
+        if not isinstance(recipients, list) or not recipients:
+            return https_fn.Response(json.dumps({"error": "recipients must be a non-empty list"}), status=400, headers=headers)
+        if len(recipients) > MAX_BATCH_RECIPIENTS:
+            return https_fn.Response(
+                json.dumps({"error": f"At most {MAX_BATCH_RECIPIENTS} recipients per request"}),
+                status=400,
+                headers=headers
+            )
+
+        results = []
+        messages = []
+        first_result = {}  # normalized number -> index of its result
+        for recipient in recipients:
+            recipient = recipient if isinstance(recipient, dict) else {}
+            phone_number = recipient.get('phoneNumber')
+            to_number = normalize_phone(phone_number)
+            result = {"phoneNumber": phone_number, "to": to_number, "success": False, "sid": None, "error": None}
+            results.append(result)
+
+            if not to_number:
+                result["error"] = "Phone number is not valid"
+            elif to_number in first_result:
+                # Same person listed twice; they get one text
+                result["duplicate"] = True
+            else:
+                first_result[to_number] = len(results) - 1
+                name = recipient.get('contractorName') or 'Contractor'
+                body = template.replace('{name}', name) if '{name}' in template else f"Hello {name}, {template}"
+                messages.append((to_number, body))
+
+        for send_result in _twilio_service().send_messages(messages):
+            result = results[first_result[send_result.to]]
+            result.update(success=send_result.error is None, sid=send_result.sid, error=send_result.error)
+
+        for result in results:
+            if result.get("duplicate"):
+                first = results[first_result[result["to"]]]
+                result.update(success=first["success"], sid=first["sid"], error=first["error"])
+
+        sent = sum(1 for result in results if result["success"] and not result.get("duplicate"))
+        return https_fn.Response(
+            json.dumps({
+                "success": all(result["success"] for result in results),
+                "sent": sent,
+                "failed": sum(1 for result in results if not result["success"]),
+                "results": results
+            }),
+            headers=headers
+        )
+    except Exception as e:
+        print(f"Error sending text messages: {str(e)}")
+        return https_fn.Response(json.dumps({"error": str(e)}), status=500, headers=headers)
+
 # Import the scheduled function (it will be registered by the decorator)
 # scheduled_project_notifications comes from app/notification_scheduler.py
 # check_notifications comes from app/notification_scheduler.py
\ No newline at end of file
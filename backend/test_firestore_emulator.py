@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for the Firestore adapter against the Firestore emulator
+Usage: FIRESTORE_EMULATOR_HOST=localhost:8080 python test_firestore_emulator.py [contractor_count]
+Start the emulator first with: firebase emulators:start --only firestore
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from google.cloud import firestore
+
+from app.firebase_adapter import FirebaseAdapter, MAX_BATCH_WRITES
+
+# Longest a snapshot listener may take to invalidate a changed document
+INVALIDATION_TIMEOUT = 5.0
+
+def main():
+    if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        print("Error: FIRESTORE_EMULATOR_HOST is not set")
+        print("This script writes test data and must only run against the emulator")
+        return 1
+
+    contractor_count = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+
+    # With the emulator host set, the client connects without credentials
+    db = firestore.Client(project=os.environ.get('GCLOUD_PROJECT', 'demo-handy'))
+    adapter = FirebaseAdapter(db)
+
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    contractor_ids = [f"contractor-{i}" for i in range(contractor_count)]
+
+    print(f"Seeding {contractor_count} contractors and 3 projects in {db.project}")
+    batch = db.batch()
+    for i, contractor_id in enumerate(contractor_ids):
+        batch.set(db.collection('contractors').document(contractor_id), {'name': f"Contractor {i}", 'phone': f"+1512555{i:04d}"})
+        if (i + 1) % MAX_BATCH_WRITES == 0:
+            batch.commit()
+            batch = db.batch()
+    for i in range(3):
+        batch.set(db.collection('projects').document(f"project-{i}"), {
+            'title': f"Project {i}",
+            'location': 'Austin, TX',
+            'startDate': tomorrow,
+            'notes': 'x' * 10000,
+            # Overlapping assignments plus one ID with no document
+            'contractors': contractor_ids[i::2] + ['missing-contractor'],
+        })
+    batch.commit()
+
+    failures = 0
+
+    started = time.perf_counter()
+    projects = adapter.get_projects_starting_tomorrow()
+    print(f"get_projects_starting_tomorrow: {len(projects)} projects in {time.perf_counter() - started:.3f}s")
+    if len(projects) != 3 or any('notes' in project for project in projects):
+        print("FAIL: expected 3 projects without unprojected fields")
+        failures += 1
+
+    started = time.perf_counter()
+    by_project = adapter.get_contractors_for_projects(projects)
+    print(f"get_contractors_for_projects: {sum(map(len, by_project.values()))} assignments in {time.perf_counter() - started:.3f}s")
+    for project in projects:
+        expected = [contractor_id for contractor_id in project['contractors'] if contractor_id != 'missing-contractor']
+        if [contractor['id'] for contractor in by_project[project['id']]] != expected:
+            print(f"FAIL: wrong contractors for {project['id']}")
+            failures += 1
+
+    if [c['id'] for c in adapter.get_contractors_for_project('project-1')] != contractor_ids[1::2]:
+        print("FAIL: wrong contractors from get_contractors_for_project")
+        failures += 1
+
+    started = time.perf_counter()
+    with adapter.notification_log_writer() as logs:
+        log_ids = [logs.add('project-0', contractor_id, f"SM{i}") for i, contractor_id in enumerate(contractor_ids * 3)]
+    print(f"notification_log_writer: {len(log_ids)} logs in {time.perf_counter() - started:.3f}s")
+    written = {doc.id for doc in db.collection('notifications').list_documents()} & set(log_ids)
+    if len(written) != len(log_ids):
+        print(f"FAIL: {len(written)} of {len(log_ids)} logs written")
+        failures += 1
+
+    # A cached document must be refreshed once it changes on the server
+    before = adapter.get_contractor_by_id('contractor-0')
+    hits = adapter.cache_stats()['hits']
+    if adapter.get_contractor_by_id('contractor-0') != before or adapter.cache_stats()['hits'] != hits + 1:
+        print("FAIL: second read of contractor-0 was not served from the cache")
+        failures += 1
+
+    db.collection('contractors').document('contractor-0').update({'name': 'Renamed Contractor'})
+    started = time.perf_counter()
+    fresh = False
+    while time.perf_counter() - started < INVALIDATION_TIMEOUT:
+        if (adapter.get_contractor_by_id('contractor-0') or {}).get('name') == 'Renamed Contractor':
+            fresh = True
+            break
+        time.sleep(0.05)
+    print(f"cache invalidation: fresh after {time.perf_counter() - started:.3f}s, stats {adapter.cache_stats()}")
+    if not fresh:
+        print(f"FAIL: contractor-0 still served stale from the cache after {INVALIDATION_TIMEOUT}s")
+        failures += 1
+    adapter.close()
+
+    # Clean up the emulator data
+    for collection in ('contractors', 'projects', 'notifications'):
+        for doc in db.collection(collection).list_documents():
+            doc.delete()
+
+    print("All checks passed" if not failures else f"{failures} checks failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
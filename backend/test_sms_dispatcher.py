@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script for the SMS dispatcher against a local stand-in for the Twilio API
+Usage: python test_sms_dispatcher.py
+
+Starts a stand-in Messages API on a free local port, points a dispatcher
+at it and checks retries, failures that must not be retried, and that one
+bad message doesn't abort a batch. No messages are sent to Twilio.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from app.sms_dispatcher import SmsDispatcher
+
+# Behaviour of the stand-in server per recipient
+OK = "+15125550001"
+THROTTLED = "+15125550002"  # 429 twice, then accepted
+REJECTED = "+15125550003"  # 400, not retried
+NO_SID = "+15125550004"  # 201 without a SID
+SLOW = "+15125550005"  # accepted, but answers after the client timeout
+
+requests = Counter()
+requests_lock = threading.Lock()
+
+class StandInTwilio(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, payload, headers=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        to_number = form["To"][0]
+        with requests_lock:
+            requests[to_number] += 1
+            count = requests[to_number]
+
+        if to_number == THROTTLED and count <= 2:
+            self.reply(429, {"code": 20429, "message": "Too Many Requests"}, {"Retry-After": "0"})
+        elif to_number == REJECTED:
+            self.reply(400, {"code": 21211, "message": "Invalid 'To' Phone Number"})
+        elif to_number == NO_SID:
+            self.reply(201, b"not json")
+        elif to_number == SLOW:
+            time.sleep(1.0)
+            try:
+                self.reply(201, {"sid": f"SM{count}"})
+            except BrokenPipeError:
+                # The client has already given up
+                pass
+        else:
+            self.reply(201, {"sid": f"SM-{to_number[-4:]}-{count}"})
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInTwilio)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    failures = 0
+
+    dispatcher = SmsDispatcher("AC123", "token", "MG123", base_url=base_url, rate_per_second=100, burst=10, max_retries=3, timeout=0.3)
+    messages = [(OK, "hello"), (THROTTLED, "hello"), (REJECTED, "hello"), (NO_SID, "hello"), (SLOW, "hello")]
+    try:
+        results = dispatcher.send_many(messages)
+    except Exception as e:
+        print(f"FAIL: send_many raised {e!r}")
+        return 1
+    finally:
+        dispatcher.close()
+
+    for result in results:
+        print(f"  {result.to}: sid={result.sid} error={result.error} requests={requests[result.to]}")
+
+    expected = {
+        # to: (succeeded, requests made)
+        OK: (True, 1),
+        THROTTLED: (True, 3),
+        REJECTED: (False, 1),
+        NO_SID: (False, 1),
+        SLOW: (False, 1),
+    }
+    if [result.to for result in results] != [to for to, _ in messages]:
+        print("FAIL: results are not in message order")
+        failures += 1
+    for result in results:
+        succeeded, request_count = expected[result.to]
+        if (result.sid is not None) != succeeded or (result.error is None) != succeeded:
+            print(f"FAIL: {result.to} should have {'succeeded' if succeeded else 'failed'}")
+            failures += 1
+        if requests[result.to] != request_count:
+            print(f"FAIL: {result.to} was posted {requests[result.to]} times, expected {request_count}")
+            failures += 1
+
+    # Nothing listens on the closed port, so every attempt fails to connect and is retried
+    server.shutdown()
+    server.server_close()
+    dispatcher = SmsDispatcher("AC123", "token", "MG123", base_url=base_url, rate_per_second=100, burst=10, max_retries=1, timeout=0.3)
+    try:
+        result, = dispatcher.send_many([(OK, "hello")])
+    finally:
+        dispatcher.close()
+    print(f"  connection refused: error={result.error}")
+    if result.sid is not None or "connecting" not in (result.error or ""):
+        print("FAIL: a refused connection should fail after retrying")
+        failures += 1
+
+    print("All checks passed" if not failures else f"{failures} checks failed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())